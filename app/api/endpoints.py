@@ -1,47 +1,484 @@
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
+from typing import List, Optional
 from datetime import datetime
-from app.services.supabase_client import supabase
-from app.services.chat_logic import obtener_respuesta
+from app.services.log_writer import escritor_logs
+from app.services.cache import cache_respuestas
+from app.services.cache_semantico import cache_semantico
+from app.services.chat_logic import contexto
+from app.services.contexto import clave_historial
+from app.services.cliente_inferencia import ErrorServidorInferencia
+from app.services import clustering, conversaciones, intenciones, metricas, panel
+from app.services.metricas import medir, etapas_chat
+from app.services.admision import admision, SaturadoError
+from app.services.idempotencia import almacen_idempotencia, ClaveReutilizadaError
+from app.services.difusion import canal_panel
+from app.services.segmentacion import instantanea_segmentacion
+from app.services.sesiones import seguimiento_sesiones
+from app.services.presupuesto import politica
+from app.services.cache import normalizar_prompt
+from app.services.single_flight import generaciones
+from app.services.inference import (
+    generar_nueva, generar_stream, registrar_turnos, respuesta_sin_generar, guardar_en_cache,
+    ColaLlenaError, TiempoAgotadoError,
+)
+import asyncio
+import hashlib
+import hmac
+import json
+import math
+import os
+import time
 import uuid
 
 router = APIRouter()  
 
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def verificar_admin(x_admin_token: str = Header(None)):
+    # Sin ADMIN_TOKEN configurado las rutas de administración no existen (falla cerrado)
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Token de administración inválido")
+
 class ChatInput(BaseModel):
     user_id: str
     message: str
+    # Si se envía, el mensaje continúa esa conversación (con su historial)
+    id_conversacion: Optional[str] = None
 
-@router.post("/chat/")
-async def chat_endpoint(data: ChatInput):
-    id_conversacion = str(uuid.uuid4())
 
-    # Guarda el mensaje del usuario
-    supabase.table("logs_chat").insert({
+class SesionFeatures(BaseModel):
+    mensajes_totales: float
+    duracion_sesion: float
+    interacciones: float
+    id_conversacion: Optional[str] = None
+
+
+class PrediccionLote(BaseModel):
+    # Sesiones con nombre de campo, o filas [mensajes_totales, duracion_sesion, interacciones]
+    sesiones: Optional[List[SesionFeatures]] = None
+    X: Optional[List[List[float]]] = None
+
+
+PREDICCION_MAX_LOTE = int(os.getenv("PREDICCION_MAX_LOTE", "10000"))
+PANEL_HEARTBEAT_SECONDS = float(os.getenv("PANEL_HEARTBEAT_SECONDS", "15"))
+PANEL_METRICAS_SECONDS = float(os.getenv("PANEL_METRICAS_SECONDS", "1"))
+
+
+def guardar_log(id_conversacion: str, user_id: str, rol: str, mensaje: str):
+    fila = {
         "id_conversacion": id_conversacion,
-        "id_usuario": data.user_id,
-        "rol": "user",
-        "mensaje": data.message,
+        "id_usuario": user_id,
+        "rol": rol,
+        "mensaje": mensaje,
         "fecha": datetime.utcnow().isoformat()
-    }).execute()
+    }
+    # No bloquea: la fila se inserta en bloque desde el escritor en segundo plano
+    escritor_logs.registrar(fila)
+    # Y llega al instante a los paneles conectados
+    canal_panel.publicar("log", fila)
+    # Features de la sesión en vivo, sin volver a leer logs_chat
+    seguimiento_sesiones.registrar(id_conversacion, user_id)
+    # Hay actividad nueva: la segmentación del panel se recalcula en la próxima consulta
+    instantanea_segmentacion.marcar_sucia()
+    if rol == "bot":
+        publicar_metricas()
+
+
+_ultimas_metricas = 0.0
+_metricas_programadas = False
+
+
+def publicar_metricas():
+    """Resumen de métricas para el panel, como mucho una vez cada PANEL_METRICAS_SECONDS.
+
+    Si llega dentro de la ventana, se programa una sola publicación al cerrarla: así la
+    última respuesta de una ráfaga también se refleja en el panel.
+    """
+    global _ultimas_metricas, _metricas_programadas
+    ahora = time.monotonic()
+    espera = _ultimas_metricas + PANEL_METRICAS_SECONDS - ahora
+    if espera > 0:
+        if not _metricas_programadas:
+            _metricas_programadas = True
+            asyncio.get_running_loop().call_later(espera, _publicar_metricas_programadas)
+        return
+    _ultimas_metricas = ahora
+    canal_panel.publicar("metricas", {
+        "cache": cache_respuestas.estadisticas(),
+        "cache_semantica": cache_semantico.estadisticas(),
+        "intenciones": intenciones.estadisticas()["tasa_sin_llm"],
+        "admision": {"activas": admision.activas, "en_espera": admision.en_espera},
+        "presupuesto_max_new_tokens": politica.actual[0],
+        "inferencia_s": metricas.inferencia.resumen(),
+    })
+
+
+def _publicar_metricas_programadas():
+    global _metricas_programadas
+    _metricas_programadas = False
+    publicar_metricas()
+
+
+def error_saturado(e: SaturadoError) -> HTTPException:
+    return HTTPException(
+        status_code=e.status_code, detail=e.detalle, headers={"Retry-After": str(e.retry_after)}
+    )
 
-    # Respuesta del bot
-    respuesta = obtener_respuesta(data.message)
+
+async def generar_con_admision(prompt: str, id_conversacion: str = None) -> str:
+    with medir(etapas_chat, etapa="admision"):
+        await admision.entrar()
+    try:
+        with medir(etapas_chat, etapa="inferencia"):
+            return await generar_nueva(prompt, id_conversacion)
+    finally:
+        admision.salir()
+
+
+async def generar_compartida(prompt: str, id_conversacion: str = None) -> str:
+    # Peticiones idénticas en curso comparten una sola generación (y un solo cupo de admisión).
+    # Con historial la respuesta es propia de la conversación, así que entra en la clave.
+    clave = normalizar_prompt(prompt)
+    if contexto.tiene_historial(id_conversacion):
+        clave = f"{id_conversacion}:{clave}"
+    return await generaciones.ejecutar(clave, lambda: generar_con_admision(prompt, id_conversacion))
+
+
+@router.post("/chat/")
+async def chat_endpoint(data: ChatInput, idempotency_key: Optional[str] = Header(None)):
+    if not idempotency_key:
+        return await procesar_chat(data)
+
+    # Un reintento con la misma clave recibe la respuesta original (o espera a que termine)
+    clave = f"{data.user_id}:{idempotency_key}"
+    huella = hashlib.sha256(json.dumps(data.dict(), sort_keys=True).encode("utf-8")).hexdigest()
+    try:
+        resultado, repetida = await almacen_idempotencia.ejecutar(clave, huella, lambda: procesar_chat(data))
+    except ClaveReutilizadaError:
+        raise HTTPException(status_code=422, detail="La Idempotency-Key ya se usó con otro mensaje")
+    return JSONResponse(content=resultado, headers={"Idempotent-Replayed": "true" if repetida else "false"})
+
+
+async def procesar_chat(data: ChatInput) -> dict:
+    id_conversacion = data.id_conversacion or str(uuid.uuid4())
+    historial = clave_historial(data.user_id, id_conversacion)
+
+    # Guarda el mensaje del usuario
+    with medir(etapas_chat, etapa="log_usuario"):
+        guardar_log(id_conversacion, data.user_id, "user", data.message)
+
+    # Respuesta del bot: ruta rápida o, si hay capacidad, generación fuera del event loop
+    with medir(etapas_chat, etapa="ruta_rapida"):
+        respuesta = respuesta_sin_generar(data.message, historial)
+    try:
+        if respuesta is None:
+            respuesta = await generar_compartida(data.message, historial)
+    except SaturadoError as e:
+        raise error_saturado(e)
+    except ColaLlenaError:
+        raise HTTPException(status_code=503, detail="Servicio ocupado, intenta de nuevo")
+    except ErrorServidorInferencia as e:
+        print("Error en el servidor de inferencia:", e)
+        raise HTTPException(status_code=503, detail="Servicio de inferencia no disponible")
+    except TiempoAgotadoError:
+        raise HTTPException(status_code=504, detail="La respuesta tardó demasiado")
 
     # Guarda la respuesta del bot
-    supabase.table("logs_chat").insert({
-        "id_conversacion": id_conversacion,
-        "id_usuario": data.user_id,
-        "rol": "bot",
-        "mensaje": respuesta,
-        "fecha": datetime.utcnow().isoformat()
-    }).execute()
+    with medir(etapas_chat, etapa="log_bot"):
+        guardar_log(id_conversacion, data.user_id, "bot", respuesta)
+    await registrar_turnos(historial, data.message, respuesta)
+
+    return {"response": respuesta, "id_conversacion": id_conversacion}
+
+
+def evento_sse(datos: dict, evento: str = None, id_evento: int = None) -> str:
+    linea_id = f"id: {id_evento}\n" if id_evento is not None else ""
+    linea_evento = f"event: {evento}\n" if evento else ""
+    return f"{linea_id}{linea_evento}data: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+# Variante en streaming (SSE): envía los tokens a medida que se generan
+@router.post("/chat/stream/")
+async def chat_stream_endpoint(data: ChatInput):
+    id_conversacion = data.id_conversacion or str(uuid.uuid4())
+    historial = clave_historial(data.user_id, id_conversacion)
+    guardar_log(id_conversacion, data.user_id, "user", data.message)
+
+    con_historial = contexto.tiene_historial(historial)
+    en_cache = respuesta_sin_generar(data.message, historial)
+    liberar = None
+    if en_cache is None:
+        # El cupo de admisión se libera cuando termina el stream
+        try:
+            await admision.entrar()
+        except SaturadoError as e:
+            raise error_saturado(e)
+        liberar = BackgroundTask(admision.salir)
+
+    async def eventos():
+        if en_cache is not None:
+            guardar_log(id_conversacion, data.user_id, "bot", en_cache)
+            await registrar_turnos(historial, data.message, en_cache)
+            yield evento_sse({"token": en_cache})
+            yield evento_sse({"response": en_cache, "id_conversacion": id_conversacion}, evento="fin")
+            return
+
+        partes = []
+        info = {}
+        try:
+            async for fragmento in generar_stream(data.message, historial, info):
+                partes.append(fragmento)
+                yield evento_sse({"token": fragmento})
+        except Exception as e:
+            print("Error generando respuesta en streaming:", e)
+            yield evento_sse({"detail": "Error generando la respuesta"}, evento="error")
+            return
+
+        respuesta = "".join(partes).strip()
+        if not con_historial:
+            guardar_en_cache(data.message, respuesta, info.get("max_new_tokens", 0))
+        # El log del bot se escribe una sola vez, con la respuesta completa
+        guardar_log(id_conversacion, data.user_id, "bot", respuesta)
+        await registrar_turnos(historial, data.message, respuesta)
+        yield evento_sse({"response": respuesta, "id_conversacion": id_conversacion}, evento="fin")
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=liberar,
+    )
+
+
+# Canal WebSocket: una conexión = una conversación con varios turnos
+@router.websocket("/ws/chat/")
+async def chat_websocket(websocket: WebSocket, user_id: str):
+    await websocket.accept()
+    sesion = conversaciones.abrir_sesion(user_id)
+    await websocket.send_json({"tipo": "sesion", "id_conversacion": sesion["id_conversacion"]})
+    try:
+        while True:
+            try:
+                datos = json.loads(await websocket.receive_text())
+            except (KeyError, ValueError):
+                # KeyError: frame binario en vez de texto
+                datos = None
+            if not isinstance(datos, dict) or not isinstance(datos.get("message", ""), str):
+                await websocket.send_json({"tipo": "error", "detail": 'Se espera un objeto JSON {"message": "..."}'})
+                continue
+            mensaje = (datos.get("message") or "").strip()
+            if not mensaje:
+                await websocket.send_json({"tipo": "error", "detail": "Mensaje vacío"})
+                continue
+            conversaciones.registrar_turno(sesion)
+            await responder_por_websocket(websocket, sesion, mensaje)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        conversaciones.cerrar_sesion(sesion)
+
+
+async def responder_por_websocket(websocket: WebSocket, sesion: dict, mensaje: str):
+    id_conversacion = sesion["id_conversacion"]
+    historial = clave_historial(sesion["id_usuario"], id_conversacion)
+    guardar_log(id_conversacion, sesion["id_usuario"], "user", mensaje)
+
+    con_historial = contexto.tiene_historial(historial)
+    respuesta = respuesta_sin_generar(mensaje, historial)
+    if respuesta is None:
+        try:
+            await admision.entrar()
+        except SaturadoError as e:
+            await websocket.send_json(
+                {"tipo": "error", "detail": e.detalle, "retry_after": e.retry_after}
+            )
+            return
+        try:
+            partes = []
+            info = {}
+            async for fragmento in generar_stream(mensaje, historial, info):
+                partes.append(fragmento)
+                await websocket.send_json({"tipo": "token", "token": fragmento})
+            respuesta = "".join(partes).strip()
+            if not con_historial:
+                guardar_en_cache(mensaje, respuesta, info.get("max_new_tokens", 0))
+        except WebSocketDisconnect:
+            raise
+        except ErrorServidorInferencia as e:
+            print("Error en el servidor de inferencia:", e)
+            await websocket.send_json({"tipo": "error", "detail": "Servicio de inferencia no disponible"})
+            return
+        except Exception as e:
+            # Fallo del modelo o timeout del streamer: se avisa y la sesión sigue abierta
+            print("Error generando respuesta por WebSocket:", repr(e))
+            await websocket.send_json({"tipo": "error", "detail": "Error generando la respuesta"})
+            return
+        finally:
+            admision.salir()
+
+    guardar_log(id_conversacion, sesion["id_usuario"], "bot", respuesta)
+    await registrar_turnos(historial, mensaje, respuesta)
+    await websocket.send_json({"tipo": "fin", "response": respuesta, "turno": sesion["turnos"]})
+
+
+# Datos del panel. Funciones síncronas: FastAPI las ejecuta en el threadpool,
+# así las consultas a Supabase no bloquean el event loop.
+@router.get("/logs-supabase/")
+def logs_supabase(
+    cursor: Optional[int] = Query(None, description="id del último log que ya tiene el cliente"),
+    limit: int = Query(panel.PANEL_LOGS_LIMIT, ge=1, le=1000),
+):
+    try:
+        logs = panel.leer_logs(cursor, limit)
+    except Exception as e:
+        print("Error leyendo logs de Supabase:", e)
+        raise HTTPException(status_code=502, detail="No se pudieron leer los logs")
+    # El cursor es el id (entero) del último log devuelto; sin logs nuevos se mantiene
+    try:
+        nuevo_cursor = int(logs[-1]["id"]) if logs else cursor
+    except (KeyError, TypeError, ValueError) as e:
+        print("logs_chat sin columna id entera para el cursor:", e)
+        raise HTTPException(status_code=502, detail="logs_chat no tiene un id entero para paginar")
+    return {"logs": logs, "cursor": nuevo_cursor}
+
+
+def respuesta_vista(vista: str, if_none_match: Optional[str]):
+    # Instantánea en memoria; si el panel ya tiene esta versión, 304 sin cuerpo
+    try:
+        cuerpo, etag = instantanea_segmentacion.obtener(vista)
+    except Exception as e:
+        print(f"Error calculando la vista {vista}:", e)
+        raise HTTPException(status_code=502, detail=f"No se pudo calcular la {vista}")
+    cabeceras = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match and (if_none_match.strip() == "*" or etag in [v.strip() for v in if_none_match.split(",")]):
+        return Response(status_code=304, headers=cabeceras)
+    return Response(content=cuerpo, media_type="application/json", headers=cabeceras)
+
+
+@router.get("/modelo/segmentacion/")
+def modelo_segmentacion(if_none_match: Optional[str] = Header(None)):
+    return respuesta_vista("segmentacion", if_none_match)
+
+
+@router.get("/modelo/prediccion/")
+def modelo_prediccion(if_none_match: Optional[str] = Header(None)):
+    # Sale de la misma instantánea que la segmentación: no lee Supabase en cada poll
+    return respuesta_vista("prediccion", if_none_match)
+
+
+# Cluster en vivo de una conversación en curso (features en memoria, sin Supabase)
+@router.get("/modelo/prediccion/{id_conversacion}")
+def modelo_prediccion_sesion(id_conversacion: str):
+    datos = seguimiento_sesiones.cluster(id_conversacion)
+    if datos is None:
+        raise HTTPException(status_code=404, detail="Conversación sin actividad reciente en este worker")
+    return datos
+
+
+# Predicción en lote: un solo transform/predict para todas las filas
+@router.post("/modelo/prediccion/")
+def modelo_prediccion_lote(data: PrediccionLote):
+    if (data.sesiones is None) == (data.X is None):
+        raise HTTPException(status_code=422, detail="Envía exactamente uno de 'sesiones' o 'X'")
+    if data.sesiones is not None:
+        filas = [[s.mensajes_totales, s.duracion_sesion, s.interacciones] for s in data.sesiones]
+    else:
+        filas = data.X
+    if len(filas) > PREDICCION_MAX_LOTE:
+        raise HTTPException(status_code=413, detail=f"Máximo {PREDICCION_MAX_LOTE} filas por lote")
+    if any(len(fila) != 3 for fila in filas):
+        raise HTTPException(status_code=422, detail="Cada fila debe tener 3 valores")
+    # json.loads acepta NaN e Infinity; el scaler no
+    if not all(math.isfinite(v) for fila in filas for v in fila):
+        raise HTTPException(status_code=422, detail="Los valores deben ser números finitos")
+    clusters = clustering.predict_clusters(filas)
+    if data.sesiones is not None:
+        return {"sesiones": [
+            {"id_conversacion": s.id_conversacion, "cluster": c} for s, c in zip(data.sesiones, clusters)
+        ]}
+    return {"clusters": clusters}
+
+
+# Stream del panel (SSE): logs nuevos y métricas en cuanto se producen.
+# El navegador reenvía Last-Event-ID al reconectar y se le reenvía lo que se perdió.
+@router.get("/panel/stream/")
+async def panel_stream(request: Request, last_event_id: Optional[str] = Header(None)):
+    ultimo_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    cola, pendientes = canal_panel.suscribir(ultimo_id)
+
+    async def eventos():
+        try:
+            yield "retry: 3000\n\n"
+            for id_evento, evento, datos in pendientes:
+                yield evento_sse(datos, evento, id_evento)
+            while True:
+                try:
+                    id_evento, evento, datos = await asyncio.wait_for(cola.get(), PANEL_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Comentario SSE: mantiene viva la conexión a través de proxies
+                    yield ": heartbeat\n\n"
+                    continue
+                yield evento_sse(datos, evento, id_evento)
+        finally:
+            canal_panel.desuscribir(cola)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Administración de la caché de respuestas
+@router.get("/admin/cache/", dependencies=[Depends(verificar_admin)])
+async def estado_cache():
+    return {
+        "exacta": cache_respuestas.estadisticas(),
+        "semantica": cache_semantico.estadisticas(),
+    }
+
+
+@router.delete("/admin/cache/", dependencies=[Depends(verificar_admin)])
+async def purgar_cache():
+    return {
+        "exacta": cache_respuestas.purgar(),
+        "semantica": cache_semantico.purgar(),
+    }
+
+
+# Uso de la ruta rápida por intención (cuánta inferencia se evita)
+@router.get("/admin/intenciones/", dependencies=[Depends(verificar_admin)])
+async def estado_intenciones():
+    return intenciones.estadisticas()
+
+
+# Estado del control de admisión (histograma de espera en cola)
+@router.get("/admin/admision/", dependencies=[Depends(verificar_admin)])
+async def estado_admision():
+    return {**admision.estadisticas(), "single_flight": generaciones.estadisticas()}
+
+
+# Métricas en formato Prometheus
+@router.get("/metrics", response_class=PlainTextResponse)
+async def exportar_metricas():
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4")
 
-    return {"response": respuesta}
 
-try:
-    supabase.table("logs_chat").insert({...}).execute()
-except Exception as e:
-    print("Error al insertar en Supabase:", e)
+# Conexiones WebSocket abiertas
+@router.get("/admin/conversaciones/", dependencies=[Depends(verificar_admin)])
+async def estado_conversaciones():
+    return {**conversaciones.estadisticas(), "con_historial": contexto.conversaciones()}
 
 
+# Presupuesto de generación vigente y últimas decisiones de la política
+@router.get("/admin/presupuesto/", dependencies=[Depends(verificar_admin)])
+async def estado_presupuesto():
+    return politica.estadisticas()
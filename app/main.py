@@ -1,11 +1,17 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import time
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
 from app.api import endpoints
+from app.services import arranque, cliente_inferencia
+from app.services.inference import INFERENCE_EXECUTOR, cerrar_executor
+from app.services.log_writer import escritor_logs
+from app.services.metricas import peticiones_http
 
 app = FastAPI()
 
@@ -18,6 +24,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Latencia por ruta (plantilla de la ruta, no la URL concreta)
+@app.middleware("http")
+async def medir_peticiones(request: Request, call_next):
+    inicio = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        ruta = request.scope.get("route")
+        peticiones_http.observar(
+            time.perf_counter() - inicio,
+            metodo=request.method,
+            ruta=ruta.path if ruta else "desconocida",
+            status=status,
+        )
+
 # Templates
 templates = Jinja2Templates(directory="app/templates")
 
@@ -34,5 +58,34 @@ async def render_panel(request: Request):
 # Incluir todas las rutas del router
 app.include_router(endpoints.router)
 
+# Sondas para el orquestador: viva (proceso responde) y lista (modelos cargados y calientes)
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    listo = arranque.esta_listo()
+    contenido = dict(arranque.estado)
+    if INFERENCE_EXECUTOR == "remote":
+        contenido["servidor_inferencia"] = await cliente_inferencia.ping()
+        listo = listo and contenido["servidor_inferencia"]
+    return JSONResponse(status_code=200 if listo else 503, content=contenido)
+
+# Cargar los modelos en segundo plano al arrancar
+@app.on_event("startup")
+def iniciar_modelos():
+    arranque.iniciar_en_segundo_plano()
+
+# Liberar el ejecutor de inferencia al apagar
+@app.on_event("shutdown")
+def apagar_inferencia():
+    cerrar_executor()
+
+# Vaciar el buffer de logs pendientes antes de salir
+@app.on_event("shutdown")
+def apagar_logs():
+    escritor_logs.detener()
+
 
 
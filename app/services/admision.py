@@ -0,0 +1,76 @@
+# admision.py
+import asyncio
+import os
+import time
+
+from app.services.metricas import Contador, Histograma, Indicador
+from app.services.presupuesto import politica
+
+# Control de admisión delante de la inferencia
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "5"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+
+
+class SaturadoError(Exception):
+    """No hay capacidad: 429 si la cola está llena, 503 si se agotó la espera."""
+
+    def __init__(self, status_code: int, detalle: str):
+        super().__init__(detalle)
+        self.status_code = status_code
+        self.detalle = detalle
+        self.retry_after = ADMISSION_RETRY_AFTER
+
+
+class Admision:
+    def __init__(self, max_concurrencia: int, max_cola: int, max_espera: float):
+        self.max_concurrencia = max_concurrencia
+        self.max_cola = max_cola
+        self.max_espera = max_espera
+        self._semaforo = None  # se crea dentro del event loop
+        self.en_espera = 0
+        self.activas = 0
+        self.espera = Histograma("admision_espera_segundos", "Tiempo de espera en la cola de admisión")
+        self.rechazadas = Contador("admision_rechazadas_total", "Peticiones rechazadas por saturación", ("status",))
+        Indicador("admision_en_espera", "Peticiones esperando cupo", lambda: self.en_espera)
+        Indicador("admision_activas", "Generaciones admitidas en curso", lambda: self.activas)
+
+    async def entrar(self):
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.max_concurrencia)
+        if self.en_espera >= self.max_cola:
+            self.rechazadas.inc(status=429)
+            raise SaturadoError(429, "Demasiadas peticiones en cola")
+
+        inicio = time.monotonic()
+        self.en_espera += 1
+        try:
+            await asyncio.wait_for(self._semaforo.acquire(), timeout=self.max_espera)
+        except asyncio.TimeoutError:
+            self.rechazadas.inc(status=503)
+            raise SaturadoError(503, "Servicio saturado, intenta de nuevo")
+        finally:
+            self.en_espera -= 1
+            self.espera.observar(time.monotonic() - inicio)
+        self.activas += 1
+
+    def salir(self):
+        self.activas -= 1
+        self._semaforo.release()
+
+    def estadisticas(self) -> dict:
+        return {
+            "max_concurrencia": self.max_concurrencia,
+            "max_cola": self.max_cola,
+            "activas": self.activas,
+            "en_espera": self.en_espera,
+            "rechazadas_429": self.rechazadas.valor(status=429),
+            "rechazadas_503": self.rechazadas.valor(status=503),
+            "espera_segundos": self.espera.resumen(),
+        }
+
+
+admision = Admision(ADMISSION_MAX_CONCURRENCY, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT)
+# Las peticiones esperando cupo también cuentan como carga para el presupuesto de generación
+politica.agregar_fuente_cola(lambda: admision.en_espera)
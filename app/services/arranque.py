@@ -0,0 +1,51 @@
+# arranque.py
+import threading
+import time
+
+from app.services import chat_logic, clustering
+from app.services.inference import INFERENCE_EXECUTOR, INFERENCE_WORKERS, calentar_pool, precargar_cache
+
+# Estado del arranque, consultado por /healthz y /readyz
+estado = {
+    "fase": "iniciando",  # iniciando -> cargando -> calentando -> listo | error
+    "error": None,
+    "segundos_carga": None,
+}
+
+
+def _cargar_y_calentar():
+    inicio = time.monotonic()
+    try:
+        estado["fase"] = "cargando"
+        clustering.cargar_modelos()
+        precargadas = precargar_cache()
+        if precargadas:
+            print(f"Caché precargada con {precargadas} respuestas")
+        # En modo remoto el modelo vive en servidor_inferencia, no en este worker
+        if INFERENCE_EXECUTOR != "remote":
+            chat_logic.cargar_modelo()
+
+            estado["fase"] = "calentando"
+            chat_logic.calentar()
+            # En modo process /chat/ genera en el pool: el modelo del proceso web queda
+            # para el streaming, y cada proceso del pool se calienta antes de dar "listo"
+            if INFERENCE_EXECUTOR == "process":
+                listos = calentar_pool()
+                print(f"Pool de inferencia: {listos}/{INFERENCE_WORKERS} procesos calientes")
+
+        estado["fase"] = "listo"
+    except Exception as e:
+        print("Error cargando los modelos:", e)
+        estado["fase"] = "error"
+        estado["error"] = str(e)
+    finally:
+        estado["segundos_carga"] = round(time.monotonic() - inicio, 2)
+
+
+def iniciar_en_segundo_plano():
+    """Carga y calienta los modelos sin bloquear el arranque del servidor."""
+    threading.Thread(target=_cargar_y_calentar, name="carga-modelos", daemon=True).start()
+
+
+def esta_listo() -> bool:
+    return estado["fase"] == "listo"
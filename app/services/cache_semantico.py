@@ -0,0 +1,167 @@
+# cache_semantico.py
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from app.services.cache import normalizar_prompt
+
+# Caché de respuestas por similitud: sirve paráfrasis de preguntas ya respondidas.
+# Apagada por defecto: es léxica (no entiende sinónimos) y el umbral está calibrado
+# solo con las preguntas de chatbot_produccion/simulacion_chatbot.py
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "2048"))
+
+# Palabras funcionales: no aportan rasgos ni cuentan como tokens cortos
+STOPWORDS = {
+    "a", "al", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los", "me", "mi", "mis",
+    "o", "para", "por", "que", "se", "su", "sus", "te", "tu", "tus", "u", "un", "una", "unos",
+    "unas", "y", "e", "le", "les", "ya",
+}
+# Cambian el sentido de la pregunta aunque el resto sea igual
+NEGACIONES = {"no", "ni", "nunca", "jamas", "tampoco", "sin", "nada", "ningun", "ninguna", "ninguno"}
+
+
+def palabras_criticas(texto: str) -> frozenset:
+    """Números, negaciones y tokens cortos (tallas, modelos): tienen que coincidir exactamente."""
+    return frozenset(
+        p for p in normalizar_prompt(texto).split()
+        if p in NEGACIONES or any(c.isdigit() for c in p) or (len(p) <= 2 and p not in STOPWORDS)
+    )
+
+
+def vectorizar(texto: str, dim: int = SEMANTIC_CACHE_DIM) -> np.ndarray:
+    """Frecuencias (sin normalizar) de palabras y n-gramas de caracteres (3-5), por hashing.
+
+    La ponderación IDF y la normalización las aplica CacheSemantico con su propio corpus.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for palabra in normalizar_prompt(texto).split():
+        if palabra in STOPWORDS:
+            continue
+        rasgos = [palabra]
+        marcada = f" {palabra} "
+        for n in (3, 4, 5):
+            rasgos.extend(marcada[i:i + n] for i in range(len(marcada) - n + 1))
+        for rasgo in rasgos:
+            h = zlib.crc32(rasgo.encode("utf-8"))
+            # El bit alto decide el signo para compensar colisiones
+            vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    return vector
+
+
+class CacheSemantico:
+    """Índice en memoria de pares prompt→respuesta con búsqueda del vecino más cercano (TF-IDF)."""
+
+    def __init__(self, max_entradas: int, umbral: float, dim: int):
+        self.max_entradas = max_entradas
+        self.umbral = umbral
+        self.dim = dim
+        self._frecuencias = np.zeros((max_entradas, dim), dtype=np.float32)
+        self._criticas = [None] * max_entradas
+        self._respuestas = [None] * max_entradas
+        self._ultimo_uso = np.zeros(max_entradas)
+        self._ocupadas = 0
+        # Cuadrados de las frecuencias (para las normas con IDF) y frecuencia documental por rasgo.
+        # Se actualizan solo en la fila que cambia: nunca se recorre toda la matriz para reindexar
+        self._cuadrados = np.zeros((max_entradas, dim), dtype=np.float32)
+        self._df = np.zeros(dim, dtype=np.int64)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def idf(self) -> np.ndarray:
+        # IDF suavizado (como TfidfVectorizer) sobre las preguntas guardadas
+        return (np.log((1 + self._ocupadas) / (1 + self._df)) + 1).astype(np.float32)
+
+    def _vecino(self, frecuencias: np.ndarray):
+        # Coseno con pesos IDF sin materializar la matriz ponderada:
+        # sum(q·d·idf²) / (|q·idf| · |d·idf|), con |d·idf|² = sum(d²·idf²)
+        idf2 = self.idf() ** 2
+        norma = float(np.sqrt((frecuencias * frecuencias) @ idf2))
+        if not norma:
+            return 0, 0.0
+        productos = self._frecuencias[:self._ocupadas] @ (frecuencias * idf2)
+        normas = np.sqrt(self._cuadrados[:self._ocupadas] @ idf2)
+        similitudes = productos / (np.where(normas > 0, normas, 1) * norma)
+        i = int(np.argmax(similitudes))
+        return i, float(similitudes[i])
+
+    def similitud(self, a: str, b: str) -> float:
+        """Coseno TF-IDF entre dos textos con el IDF actual (para calibrar el umbral)."""
+        with self._lock:
+            idf = self.idf()
+        va, vb = vectorizar(a, self.dim) * idf, vectorizar(b, self.dim) * idf
+        normas = np.linalg.norm(va) * np.linalg.norm(vb)
+        return float(va @ vb / normas) if normas else 0.0
+
+    def buscar(self, prompt: str):
+        frecuencias = vectorizar(prompt, self.dim)
+        criticas = palabras_criticas(prompt)
+        with self._lock:
+            if self._ocupadas:
+                i, similitud = self._vecino(frecuencias)
+                if similitud >= self.umbral and self._criticas[i] == criticas:
+                    self._ultimo_uso[i] = time.monotonic()
+                    self.aciertos += 1
+                    return self._respuestas[i]
+            self.fallos += 1
+            return None
+
+    def guardar(self, prompt: str, respuesta: str):
+        frecuencias = vectorizar(prompt, self.dim)
+        if not frecuencias.any():
+            return
+        criticas = palabras_criticas(prompt)
+        with self._lock:
+            if self._ocupadas:
+                i, similitud = self._vecino(frecuencias)
+                if similitud >= 0.999 and self._criticas[i] == criticas:
+                    # Es la misma pregunta: solo se actualiza la respuesta
+                    self._respuestas[i] = respuesta
+                    self._ultimo_uso[i] = time.monotonic()
+                    return
+            if self._ocupadas < self.max_entradas:
+                i = self._ocupadas
+                self._ocupadas += 1
+            else:
+                # Lleno: se reemplaza la entrada usada hace más tiempo
+                i = int(np.argmin(self._ultimo_uso))
+                self._df -= self._frecuencias[i] != 0
+            self._df += frecuencias != 0
+            self._frecuencias[i] = frecuencias
+            self._cuadrados[i] = frecuencias * frecuencias
+            self._criticas[i] = criticas
+            self._respuestas[i] = respuesta
+            self._ultimo_uso[i] = time.monotonic()
+
+    def purgar(self) -> int:
+        with self._lock:
+            n = self._ocupadas
+            self._frecuencias[:] = 0
+            self._criticas = [None] * self.max_entradas
+            self._respuestas = [None] * self.max_entradas
+            self._cuadrados[:] = 0
+            self._df[:] = 0
+            self._ultimo_uso[:] = 0
+            self._ocupadas = 0
+            return n
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "entradas": self._ocupadas,
+                "max_entradas": self.max_entradas,
+                "umbral": self.umbral,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+            }
+
+
+cache_semantico = CacheSemantico(SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_DIM)
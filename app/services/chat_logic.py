@@ -1,8 +1,396 @@
-from transformers import pipeline
+import bisect
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
 
-generator = pipeline("text2text-generation", model="tiiuae/falcon-rw-1b")
+from app.services import metricas
+from app.services.contexto import ContextoConversaciones
+from app.services.presupuesto import GEN_MAX_NEW_TOKENS, GEN_MIN_NEW_TOKENS, politica
 
-def obtener_respuesta(prompt: str) -> str:
-    entrada = f"Responde como un agente de eCommerce: {prompt}"
-    resultado = generator(entrada, max_new_tokens=60)
-    return resultado[0]["generated_text"].strip()
+MODEL_NAME = os.getenv("MODEL_NAME", "tiiuae/falcon-rw-1b")
+
+# Modo de inferencia en CPU: "fp32" o "int8" (cuantización dinámica de las capas Linear)
+INFERENCE_PRECISION = os.getenv("INFERENCE_PRECISION", "fp32")
+# Hilos de torch por worker (0 = valor por defecto de torch)
+INTRA_OP_THREADS = int(os.getenv("INTRA_OP_THREADS", "0"))
+INTER_OP_THREADS = int(os.getenv("INTER_OP_THREADS", "0"))
+
+# El modelo se carga bajo demanda (o en el arranque en segundo plano), no al importar
+generator = None
+_lock_carga = threading.Lock()
+
+PREFIJO = "Responde como un agente de eCommerce:"
+# Máximo sin carga; bajo carga presupuesto.politica lo reduce
+MAX_NEW_TOKENS = GEN_MAX_NEW_TOKENS
+# Máximo de espera entre fragmentos del streaming (misma variable que inference.INFERENCE_TIMEOUT)
+STREAM_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "30"))
+
+# Micro-batching: agrupa prompts concurrentes en una sola llamada al modelo
+BATCH_ENABLED = os.getenv("BATCH_ENABLED", "1") == "1"
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "20"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+# Límites (en tokens) de los buckets de longitud: solo se agrupan prompts de largo parecido
+BATCH_BUCKETS = [int(x) for x in os.getenv("BATCH_BUCKETS", "16,32,64,128,256").split(",") if x]
+# Guarda contra inanición: pasado este tiempo, el bucket con la petición más vieja va primero
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "200"))
+
+
+def configurar_hilos():
+    import torch
+
+    if INTRA_OP_THREADS > 0:
+        torch.set_num_threads(INTRA_OP_THREADS)
+    if INTER_OP_THREADS > 0:
+        try:
+            torch.set_num_interop_threads(INTER_OP_THREADS)
+        except RuntimeError:
+            # Solo se puede fijar antes del primer trabajo paralelo de torch
+            print("No se pudo fijar INTER_OP_THREADS: torch ya inició su pool")
+
+
+def crear_pipeline(precision: str = INFERENCE_PRECISION):
+    """Construye el pipeline en la precisión pedida, listo para generar en lote."""
+    import torch
+    from transformers import pipeline
+
+    modelo = pipeline("text2text-generation", model=MODEL_NAME)
+    if precision == "int8":
+        modelo.model = torch.ao.quantization.quantize_dynamic(
+            modelo.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    elif precision != "fp32":
+        raise ValueError(f"INFERENCE_PRECISION no soportada: {precision}")
+    modelo.model.eval()
+
+    tokenizer = modelo.tokenizer
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    # Los modelos causales continúan el texto, así que el padding va a la izquierda
+    if not modelo.model.config.is_encoder_decoder:
+        tokenizer.padding_side = "left"
+    return modelo
+
+
+def cargar_modelo():
+    """Carga el pipeline una sola vez, aunque lo pidan varios hilos a la vez."""
+    global generator
+    if generator is not None:
+        return generator
+    with _lock_carga:
+        if generator is None:
+            configurar_hilos()
+            generator = crear_pipeline()
+    return generator
+
+
+def calentar():
+    """Generación de prueba para que la primera petición real no pague la inicialización."""
+    # Con presupuesto explícito: la latencia en frío no entra en la ventana de la política
+    generar_lote([construir_entrada("Hola")], max_new_tokens=MAX_NEW_TOKENS)
+    # Recorrer el vocabulario tarda: se hace aquí y no en la primera petición con carga alta
+    ids_fin_oracion(cargar_modelo().tokenizer)
+
+
+def construir_entrada(prompt: str) -> str:
+    return f"{PREFIJO} {prompt}"
+
+
+def codificar(texto: str) -> list:
+    return cargar_modelo().tokenizer(texto, add_special_tokens=False)["input_ids"]
+
+
+# Historial por conversación; cada turno se codifica una sola vez y se reutiliza
+contexto = ContextoConversaciones(PREFIJO, codificar)
+
+
+def construir_ids(prompt: str, id_conversacion: str = None) -> list:
+    """Ids de entrada: con la ventana de historial si la conversación tiene turnos previos."""
+    if contexto.tiene_historial(id_conversacion):
+        return contexto.construir_ids(id_conversacion, prompt)
+    return cargar_modelo().tokenizer(construir_entrada(prompt))["input_ids"]
+
+
+_ids_fin_oracion = None
+
+
+def ids_fin_oracion(tokenizer):
+    """Tensor con los tokens cuyo texto termina en . ! o ? (se calcula una vez por proceso)."""
+    import torch
+
+    global _ids_fin_oracion
+    if _ids_fin_oracion is None:
+        _ids_fin_oracion = torch.tensor([
+            i for i in range(len(tokenizer))
+            if tokenizer.decode([i]).rstrip().endswith((".", "!", "?"))
+        ])
+    return _ids_fin_oracion
+
+
+def _criterio_corte(tokenizer, largo_prompt: int):
+    """StoppingCriteria que corta cada secuencia al cerrar una oración tras un mínimo de tokens."""
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    fin_oracion = ids_fin_oracion(tokenizer)
+
+    # Devuelve un bool por fila para cortar solo las secuencias que terminaron: los
+    # StoppingCriteria por fila existen desde transformers 4.39 (ver requirements.txt)
+    class CorteEnOracion(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            if input_ids.shape[1] - largo_prompt < GEN_MIN_NEW_TOKENS:
+                return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+            return torch.isin(input_ids[:, -1], fin_oracion.to(input_ids.device))
+
+    return StoppingCriteriaList([CorteEnOracion()])
+
+
+def _parametros_generacion(tokenizer, largo_prompt: int, max_new_tokens: int = None) -> dict:
+    if max_new_tokens is not None:
+        return {"max_new_tokens": max_new_tokens}
+    max_new_tokens, cortar = politica.decidir()
+    parametros = {"max_new_tokens": max_new_tokens}
+    if cortar:
+        parametros["stopping_criteria"] = _criterio_corte(tokenizer, largo_prompt)
+    return parametros
+
+
+def generar_lote(entradas: list, max_new_tokens: int = None):
+    """Genera las respuestas de varias entradas (textos o listas de ids) en un único lote con padding.
+
+    Sin max_new_tokens explícito, el presupuesto lo decide la política según la carga (y solo
+    entonces la latencia alimenta a la política). Devuelve (respuestas, max_new_tokens usado).
+    """
+    import torch
+
+    modelo = cargar_modelo()
+    tokenizer = modelo.tokenizer
+    model = modelo.model
+    ids = [e if isinstance(e, list) else tokenizer(e)["input_ids"] for e in entradas]
+    lote = tokenizer.pad({"input_ids": ids}, return_tensors="pt").to(model.device)
+    reales = int(lote["attention_mask"].sum())
+    con_relleno = lote["input_ids"].numel()
+    metricas.tokens_reales_lote.inc(reales)
+    metricas.tokens_con_relleno_lote.inc(con_relleno)
+    metricas.eficiencia_relleno.observar(reales / con_relleno)
+    parametros = _parametros_generacion(tokenizer, lote["input_ids"].shape[1], max_new_tokens)
+    inicio = time.perf_counter()
+    with metricas.medir(metricas.inferencia, modo="lote"), torch.no_grad():
+        salida = model.generate(**lote, pad_token_id=tokenizer.pad_token_id, **parametros)
+    if max_new_tokens is None:
+        politica.registrar_latencia(time.perf_counter() - inicio)
+    if not model.config.is_encoder_decoder:
+        salida = salida[:, lote["input_ids"].shape[1]:]
+    metricas.tamano_lote.observar(len(entradas))
+    metricas.tokens_entrada.inc(reales)
+    metricas.tokens_generados.inc(int((salida != tokenizer.pad_token_id).sum()))
+    respuestas = [texto.strip() for texto in tokenizer.batch_decode(salida, skip_special_tokens=True)]
+    return respuestas, parametros["max_new_tokens"]
+
+
+class MicroBatcher:
+    """Junta entradas durante una ventana corta y genera juntas las de longitud parecida.
+
+    Cada entrada va a un bucket según su número de tokens. En cada ciclo se genera el
+    bucket más lleno, salvo que alguna petición lleve más de max_espera_ms esperando:
+    entonces va primero el bucket de la más vieja.
+    """
+
+    def __init__(self, ventana_ms: float, max_lote: int, buckets: list, max_espera_ms: float):
+        self.ventana = ventana_ms / 1000
+        self.max_lote = max_lote
+        self.buckets = sorted(buckets)
+        self.max_espera = max_espera_ms / 1000
+        self._cola = queue.Queue()
+        self._pendientes = [deque() for _ in range(len(self.buckets) + 1)]
+        self._hilo = None
+        self._lock = threading.Lock()
+
+    def enviar(self, ids) -> Future:
+        """`ids` es la lista de ids o una función que la arma (se llama en el hilo del batcher)."""
+        self._asegurar_hilo()
+        futuro = Future()
+        self._cola.put((ids, futuro, time.monotonic()))
+        return futuro
+
+    def en_cola(self) -> int:
+        return self._cola.qsize() + sum(len(p) for p in self._pendientes)
+
+    def _asegurar_hilo(self):
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name="micro-batcher", daemon=True)
+                self._hilo.start()
+
+    def _agregar(self, item):
+        ids, futuro, llegada = item
+        if callable(ids):
+            # Tokenizar aquí y no en enviar(): enviar() se llama desde el event loop
+            try:
+                ids = ids()
+            except Exception as e:
+                if futuro.set_running_or_notify_cancel():
+                    futuro.set_exception(e)
+                return
+        indice = bisect.bisect_left(self.buckets, len(ids))
+        self._pendientes[indice].append((ids, futuro, llegada))
+
+    def _mas_vieja(self) -> float:
+        return min(p[0][2] for p in self._pendientes if p)
+
+    def _bucle(self):
+        while True:
+            if not any(self._pendientes):
+                self._agregar(self._cola.get())
+            # Lo que ya está en la cola entra sin esperar
+            while True:
+                try:
+                    self._agregar(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            if not any(self._pendientes):
+                continue
+            # Se recoge hasta que la petición más vieja cumple la ventana o un bucket se llena
+            limite = self._mas_vieja() + self.ventana
+            while max(len(p) for p in self._pendientes) < self.max_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    self._agregar(self._cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            self._procesar(self._elegir_lote())
+
+    def _elegir_lote(self) -> list:
+        ahora = time.monotonic()
+        con_items = [i for i, p in enumerate(self._pendientes) if p]
+        if ahora - self._mas_vieja() > self.max_espera:
+            indice = min(con_items, key=lambda i: self._pendientes[i][0][2])
+        else:
+            # El más lleno; a igualdad, el más corto (genera antes)
+            indice = max(con_items, key=lambda i: (len(self._pendientes[i]), -i))
+        pendientes = self._pendientes[indice]
+        metricas.lotes_por_bucket.inc(bucket=self._nombre_bucket(indice))
+        return [pendientes.popleft() for _ in range(min(self.max_lote, len(pendientes)))]
+
+    def _nombre_bucket(self, indice: int) -> str:
+        return str(self.buckets[indice]) if indice < len(self.buckets) else "+Inf"
+
+    def _procesar(self, lote: list):
+        # Descarta las peticiones que ya se cancelaron (p. ej. por timeout)
+        lote = [(ids, futuro) for ids, futuro, _ in lote if futuro.set_running_or_notify_cancel()]
+        if not lote:
+            return
+        try:
+            respuestas, presupuesto = generar_lote([ids for ids, _ in lote])
+        except Exception as e:
+            for _, futuro in lote:
+                futuro.set_exception(e)
+            return
+        for (_, futuro), respuesta in zip(lote, respuestas):
+            futuro.set_result((respuesta, presupuesto))
+
+
+batcher = MicroBatcher(BATCH_WINDOW_MS, BATCH_MAX_SIZE, BATCH_BUCKETS, BATCH_MAX_WAIT_MS)
+politica.agregar_fuente_cola(batcher.en_cola)
+
+
+def enviar_a_lote(prompt: str, id_conversacion: str = None) -> Future:
+    """Encola el prompt en el micro-batcher; el Future se resuelve con (respuesta, max_new_tokens)."""
+    return batcher.enviar(lambda: construir_ids(prompt, id_conversacion))
+
+
+def obtener_respuesta(prompt: str, id_conversacion: str = None):
+    """(respuesta, max_new_tokens con el que se generó)."""
+    if BATCH_ENABLED:
+        return enviar_a_lote(prompt, id_conversacion).result()
+    if contexto.tiene_historial(id_conversacion):
+        respuestas, presupuesto = generar_lote([construir_ids(prompt, id_conversacion)])
+        return respuestas[0], presupuesto
+    entrada = construir_entrada(prompt)
+    presupuesto = politica.decidir()[0]
+    with metricas.medir(metricas.inferencia, modo="directo"):
+        resultado = cargar_modelo()(entrada, max_new_tokens=presupuesto)
+    return resultado[0]["generated_text"].strip(), presupuesto
+
+
+_proceso_listo = False
+
+
+def preparar_proceso() -> int:
+    """Carga y calienta el modelo en un proceso del pool (una sola vez); devuelve su pid."""
+    global _proceso_listo
+    if not _proceso_listo:
+        cargar_modelo()
+        calentar()
+        _proceso_listo = True
+    return os.getpid()
+
+
+def obtener_respuesta_en_proceso(prompt: str, id_conversacion: str = None, turnos: list = None):
+    """obtener_respuesta para los procesos del pool (INFERENCE_EXECUTOR=process).
+
+    El historial vive en el proceso web: llega con cada petición en `turnos`.
+    """
+    contexto.sincronizar(id_conversacion, turnos or [])
+    return obtener_respuesta(prompt, id_conversacion)
+
+
+def generar_stream(prompt: str, id_conversacion: str = None, info: dict = None):
+    """Itera los fragmentos de texto de la respuesta a medida que el modelo los genera.
+
+    Si se pasa `info`, se anota ahí el max_new_tokens usado.
+    """
+    import torch
+    from transformers import TextIteratorStreamer
+
+    modelo = cargar_modelo()
+    tokenizer = modelo.tokenizer
+    model = modelo.model
+    entrada = tokenizer.pad(
+        {"input_ids": [construir_ids(prompt, id_conversacion)]}, return_tensors="pt"
+    ).to(model.device)
+    # Con timeout: si la generación se cuelga, el consumidor no espera para siempre
+    streamer = TextIteratorStreamer(
+        tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=STREAM_TIMEOUT
+    )
+    error = []
+
+    metricas.tokens_entrada.inc(int(entrada["input_ids"].shape[1]))
+    parametros = _parametros_generacion(tokenizer, entrada["input_ids"].shape[1])
+    if info is not None:
+        info["max_new_tokens"] = parametros["max_new_tokens"]
+
+    def _generar():
+        inicio = time.perf_counter()
+        try:
+            with metricas.medir(metricas.inferencia, modo="stream"), torch.no_grad():
+                model.generate(
+                    **entrada,
+                    pad_token_id=tokenizer.pad_token_id,
+                    streamer=streamer,
+                    **parametros,
+                )
+            politica.registrar_latencia(time.perf_counter() - inicio)
+        except Exception as e:
+            error.append(e)
+        finally:
+            # Siempre se cierra el streamer; si no, el for de abajo no termina nunca
+            streamer.end()
+
+    threading.Thread(target=_generar, name="stream-generacion", daemon=True).start()
+    for fragmento in streamer:
+        metricas.tokens_generados.inc(len(tokenizer.encode(fragmento, add_special_tokens=False)))
+        yield fragmento
+    if error:
+        raise error[0]
+
+
+def registrar_turnos(id_conversacion: str, mensaje: str, respuesta: str):
+    """Añade el intercambio al historial para los turnos siguientes."""
+    if id_conversacion:
+        contexto.agregar_turno(id_conversacion, "user", mensaje)
+        contexto.agregar_turno(id_conversacion, "bot", respuesta)
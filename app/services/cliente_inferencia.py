@@ -0,0 +1,71 @@
+# cliente_inferencia.py
+import asyncio
+
+from app.services.servidor_inferencia import (
+    INFERENCE_SERVER_ADDRESS,
+    escribir_mensaje,
+    leer_mensaje,
+    parsear_direccion,
+)
+
+
+class ErrorServidorInferencia(Exception):
+    """El servidor de inferencia respondió con un error o no está disponible."""
+
+
+async def _conectar():
+    tipo, destino = parsear_direccion(INFERENCE_SERVER_ADDRESS)
+    try:
+        if tipo == "unix":
+            return await asyncio.open_unix_connection(destino)
+        return await asyncio.open_connection(destino[0], destino[1])
+    except OSError as e:
+        raise ErrorServidorInferencia(f"no se pudo conectar a {INFERENCE_SERVER_ADDRESS}: {e}")
+
+
+async def _pedir(mensaje: dict) -> dict:
+    # Una conexión por petición: en un socket local es barata y permite concurrencia sin pool
+    reader, writer = await _conectar()
+    try:
+        await escribir_mensaje(writer, mensaje)
+        respuesta = await leer_mensaje(reader)
+    finally:
+        writer.close()
+    if not respuesta.get("ok"):
+        raise ErrorServidorInferencia(respuesta.get("error", "error desconocido"))
+    return respuesta
+
+
+async def generar(prompt: str, id_conversacion: str = None):
+    """(respuesta, max_new_tokens con el que la generó el servidor)."""
+    respuesta = await _pedir({"op": "generar", "prompt": prompt, "id_conversacion": id_conversacion})
+    return respuesta["respuesta"], respuesta.get("max_new_tokens") or 0
+
+
+async def generar_stream(prompt: str, id_conversacion: str = None, info: dict = None):
+    reader, writer = await _conectar()
+    try:
+        await escribir_mensaje(writer, {"op": "stream", "prompt": prompt, "id_conversacion": id_conversacion})
+        while True:
+            mensaje = await leer_mensaje(reader)
+            if "token" in mensaje:
+                yield mensaje["token"]
+            elif mensaje.get("fin"):
+                if info is not None:
+                    info["max_new_tokens"] = mensaje.get("max_new_tokens") or 0
+                return
+            else:
+                raise ErrorServidorInferencia(mensaje.get("error", "error desconocido"))
+    finally:
+        writer.close()
+
+
+async def registrar_turnos(id_conversacion: str, mensaje: str, respuesta: str):
+    await _pedir({"op": "turnos", "id_conversacion": id_conversacion, "mensaje": mensaje, "respuesta": respuesta})
+
+
+async def ping() -> bool:
+    try:
+        return (await _pedir({"op": "ping"}))["listo"]
+    except ErrorServidorInferencia:
+        return False
@@ -2,15 +2,78 @@
 import joblib
 import numpy as np
 import os
+import threading
+from datetime import datetime
 
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 
-# Cargar una sola vez
-scaler = joblib.load(os.path.join(BASE_DIR, 'models', 'scaler.pkl'))
-kmeans = joblib.load(os.path.join(BASE_DIR, 'models', 'kmeans_model.pkl'))
+# Se cargan una sola vez, la primera vez que se necesitan
+scaler = None
+kmeans = None
+_lock_carga = threading.Lock()
+
+# Sesiones más cortas no se segmentan: el modelo se entrenó sin ellas
+MIN_MENSAJES_SESION = 3
+
+def cargar_modelos():
+    global scaler, kmeans
+    with _lock_carga:
+        if kmeans is None:
+            scaler = joblib.load(os.path.join(BASE_DIR, 'models', 'scaler.pkl'))
+            kmeans = joblib.load(os.path.join(BASE_DIR, 'models', 'kmeans_model.pkl'))
+
+def predict_clusters(X):
+    """Cluster de cada fila de X (mensajes_totales, duracion_sesion, interacciones) en una sola pasada."""
+    if kmeans is None:
+        cargar_modelos()
+    X = np.asarray(X, dtype=float).reshape(-1, 3)
+    if len(X) == 0:
+        return []
+    return [int(c) for c in kmeans.predict(scaler.transform(X))]
 
 def predict_cluster(mensajes_totales, duracion_sesion, interacciones):
-    X = np.array([[mensajes_totales, duracion_sesion, interacciones]])
-    X_scaled = scaler.transform(X)
-    cluster = kmeans.predict(X_scaled)[0]
-    return int(cluster)
+    return predict_clusters([[mensajes_totales, duracion_sesion, interacciones]])[0]
+
+def calcular_features_sesiones(filas, min_mensajes=MIN_MENSAJES_SESION):
+    """Agrega filas de logs_chat por conversación, igual que notebooks/clustering_training.py."""
+    sesiones = {}
+    for fila in filas:
+        fecha = datetime.fromisoformat(str(fila['fecha']).replace('Z', '+00:00'))
+        sesion = sesiones.setdefault(fila['id_conversacion'], {
+            'id_conversacion': fila['id_conversacion'],
+            'id_usuario': fila.get('id_usuario'),
+            'mensajes_totales': 0,
+            'fecha_min': fecha,
+            'fecha_max': fecha,
+        })
+        sesion['mensajes_totales'] += 1
+        sesion['fecha_min'] = min(sesion['fecha_min'], fecha)
+        sesion['fecha_max'] = max(sesion['fecha_max'], fecha)
+
+    resultado = []
+    for sesion in sesiones.values():
+        if sesion['mensajes_totales'] < min_mensajes:
+            continue
+        resultado.append({
+            'id_conversacion': sesion['id_conversacion'],
+            'id_usuario': sesion['id_usuario'],
+            'mensajes_totales': sesion['mensajes_totales'],
+            'duracion_sesion': (sesion['fecha_max'] - sesion['fecha_min']).total_seconds(),
+            'interacciones': sesion['mensajes_totales'],
+            'ultima_actividad': sesion['fecha_max'].isoformat(),
+        })
+    return resultado
+
+def segmentar_sesiones(sesiones):
+    """Asigna cluster a cada sesión y cuenta cuántas hay en cada uno."""
+    clusters = predict_clusters([
+        [s['mensajes_totales'], s['duracion_sesion'], s['interacciones']] for s in sesiones
+    ])
+    conteos = {}
+    for sesion, cluster in zip(sesiones, clusters):
+        sesion['cluster'] = cluster
+        conteos[cluster] = conteos.get(cluster, 0) + 1
+    return {
+        'total_sesiones': len(sesiones),
+        'clusters': {str(c): n for c, n in sorted(conteos.items())},
+    }
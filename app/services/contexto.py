@@ -0,0 +1,111 @@
+# contexto.py
+import json
+import os
+import threading
+from collections import OrderedDict, deque
+
+# Contexto multi-turno: ventana de turnos anteriores limitada por tokens
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "512"))
+CONTEXT_MAX_TURNS = int(os.getenv("CONTEXT_MAX_TURNS", "20"))
+CONTEXT_MAX_CONVERSATIONS = int(os.getenv("CONTEXT_MAX_CONVERSATIONS", "1000"))
+
+ETIQUETAS = {"user": "Cliente", "bot": "Agente"}
+
+
+def clave_historial(id_usuario: str, id_conversacion: str) -> str:
+    """Clave del historial: la conversación dentro del usuario que la escribe.
+
+    El id_conversacion lo manda el cliente; así nadie lee ni amplía el historial de otro
+    usuario aunque conozca el id (p. ej. desde /logs-supabase/).
+    """
+    return json.dumps([id_usuario, id_conversacion])
+
+
+class Turno:
+    """Texto de un turno y sus ids de tokens, que se codifican una sola vez."""
+
+    __slots__ = ("rol", "texto", "ids")
+
+    def __init__(self, rol: str, texto: str):
+        self.rol = rol
+        self.texto = texto
+        self.ids = None
+
+
+class ContextoConversaciones:
+    def __init__(self, prefijo: str, codificar):
+        self.prefijo = prefijo
+        self.codificar = codificar  # texto -> lista de ids, sin tokens especiales
+        self._ids_prefijo = None
+        self._historiales = OrderedDict()  # id_conversacion -> deque de Turno
+        self._lock = threading.Lock()
+
+    def _ids(self, turno: Turno) -> list:
+        if turno.ids is None:
+            turno.ids = self.codificar(f"\n{ETIQUETAS[turno.rol]}: {turno.texto}")
+        return turno.ids
+
+    def tiene_historial(self, id_conversacion: str) -> bool:
+        return bool(id_conversacion) and id_conversacion in self._historiales
+
+    def agregar_turno(self, id_conversacion: str, rol: str, texto: str):
+        # No codifica aquí: se hace al armar la próxima entrada (en el hilo del micro-batcher
+        # o del executor, no en el event loop)
+        with self._lock:
+            historial = self._historiales.get(id_conversacion)
+            if historial is None:
+                historial = self._historiales[id_conversacion] = deque(maxlen=CONTEXT_MAX_TURNS)
+            historial.append(Turno(rol, texto))
+            self._historiales.move_to_end(id_conversacion)
+            while len(self._historiales) > CONTEXT_MAX_CONVERSATIONS:
+                self._historiales.popitem(last=False)
+
+    def turnos(self, id_conversacion: str) -> list:
+        """[(rol, texto), ...] de la conversación, para pasarlos a otro proceso."""
+        with self._lock:
+            return [(t.rol, t.texto) for t in self._historiales.get(id_conversacion, ())]
+
+    def sincronizar(self, id_conversacion: str, turnos: list):
+        """Deja el historial igual a `turnos`; si ya coincide, conserva los ids ya codificados."""
+        if not id_conversacion:
+            return
+        with self._lock:
+            actual = self._historiales.get(id_conversacion)
+            if actual is not None and [(t.rol, t.texto) for t in actual] == list(turnos):
+                self._historiales.move_to_end(id_conversacion)
+                return
+            if not turnos:
+                self._historiales.pop(id_conversacion, None)
+                return
+            self._historiales[id_conversacion] = deque(
+                (Turno(rol, texto) for rol, texto in turnos), maxlen=CONTEXT_MAX_TURNS
+            )
+            self._historiales.move_to_end(id_conversacion)
+            while len(self._historiales) > CONTEXT_MAX_CONVERSATIONS:
+                self._historiales.popitem(last=False)
+
+    def construir_ids(self, id_conversacion: str, mensaje: str) -> list:
+        """Prefijo + los turnos más recientes que quepan en el presupuesto + el mensaje nuevo."""
+        if self._ids_prefijo is None:
+            self._ids_prefijo = self.codificar(self.prefijo)
+        nuevo = self.codificar(f"\n{ETIQUETAS['user']}: {mensaje}\n{ETIQUETAS['bot']}:")
+
+        with self._lock:
+            turnos = list(self._historiales.get(id_conversacion, ()))
+        presupuesto = CONTEXT_MAX_TOKENS - len(self._ids_prefijo) - len(nuevo)
+        ventana = []
+        for turno in reversed(turnos):
+            ids = self._ids(turno)
+            if len(ids) > presupuesto:
+                break
+            ventana.append(ids)
+            presupuesto -= len(ids)
+
+        entrada = list(self._ids_prefijo)
+        for ids in reversed(ventana):
+            entrada.extend(ids)
+        entrada.extend(nuevo)
+        return entrada
+
+    def conversaciones(self) -> int:
+        return len(self._historiales)
@@ -0,0 +1,35 @@
+# conversaciones.py
+import time
+import uuid
+
+# Estado en memoria de las conexiones WebSocket abiertas (una conversación por conexión)
+sesiones_activas = {}
+
+
+def abrir_sesion(id_usuario: str) -> dict:
+    ahora = time.time()
+    sesion = {
+        "id_conversacion": str(uuid.uuid4()),
+        "id_usuario": id_usuario,
+        "turnos": 0,
+        "inicio": ahora,
+        "ultima_actividad": ahora,
+    }
+    sesiones_activas[sesion["id_conversacion"]] = sesion
+    return sesion
+
+
+def registrar_turno(sesion: dict):
+    sesion["turnos"] += 1
+    sesion["ultima_actividad"] = time.time()
+
+
+def cerrar_sesion(sesion: dict):
+    sesiones_activas.pop(sesion["id_conversacion"], None)
+
+
+def estadisticas() -> dict:
+    return {
+        "sesiones_activas": len(sesiones_activas),
+        "turnos_en_curso": sum(s["turnos"] for s in sesiones_activas.values()),
+    }
@@ -0,0 +1,50 @@
+# difusion.py
+import asyncio
+import os
+from collections import deque
+
+from app.services.metricas import Indicador
+
+# Canal en proceso para empujar eventos (logs nuevos, métricas) a los paneles conectados
+DIFUSION_HISTORIAL = int(os.getenv("DIFUSION_HISTORIAL", "500"))
+DIFUSION_MAX_PENDIENTES = int(os.getenv("DIFUSION_MAX_PENDIENTES", "1000"))
+
+
+class CanalDifusion:
+    """Reparte cada evento a todos los suscriptores. Se usa siempre desde el event loop."""
+
+    def __init__(self, historial: int, max_pendientes: int):
+        self.max_pendientes = max_pendientes
+        self._suscriptores = set()
+        self._historial = deque(maxlen=historial)  # para reenviar tras una reconexión
+        self._ultimo_id = 0
+        Indicador("difusion_suscriptores", "Paneles conectados al stream", lambda: len(self._suscriptores))
+
+    def publicar(self, evento: str, datos: dict):
+        self._ultimo_id += 1
+        mensaje = (self._ultimo_id, evento, datos)
+        self._historial.append(mensaje)
+        for cola in self._suscriptores:
+            if cola.full():
+                # Un panel lento pierde lo más viejo en vez de frenar a los demás
+                cola.get_nowait()
+            cola.put_nowait(mensaje)
+
+    def suscribir(self, ultimo_id: int = None):
+        """Devuelve (cola, eventos a reenviar). Si el historial ya no alcanza, se avisa con 'reset'."""
+        cola = asyncio.Queue(maxsize=self.max_pendientes)
+        self._suscriptores.add(cola)
+        if ultimo_id is None:
+            return cola, []
+        # Id de otro worker o de antes de un reinicio: no se sabe qué se perdió
+        if ultimo_id > self._ultimo_id:
+            return cola, [(self._ultimo_id, "reset", {})]
+        if self._historial and self._historial[0][0] > ultimo_id + 1:
+            return cola, [(self._ultimo_id, "reset", {})]
+        return cola, [m for m in self._historial if m[0] > ultimo_id]
+
+    def desuscribir(self, cola):
+        self._suscriptores.discard(cola)
+
+
+canal_panel = CanalDifusion(DIFUSION_HISTORIAL, DIFUSION_MAX_PENDIENTES)
@@ -0,0 +1,72 @@
+# idempotencia.py
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from app.services.metricas import Contador, Indicador
+
+# Respuestas recientes por Idempotency-Key, para que los reintentos no repitan el trabajo
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "300"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+
+
+class ClaveReutilizadaError(Exception):
+    """La misma Idempotency-Key llegó con otro cuerpo de petición."""
+
+
+class AlmacenIdempotencia:
+    """Guarda el resultado (o la ejecución en curso) de cada clave durante un TTL."""
+
+    def __init__(self, ttl: float, max_claves: int):
+        self.ttl = ttl
+        self.max_claves = max_claves
+        self._entradas = OrderedDict()  # clave -> (asyncio.Future, expira_en, huella del cuerpo)
+        self.repeticiones = Contador("idempotencia_repeticiones_total", "Reintentos servidos sin recalcular")
+        Indicador("idempotencia_claves", "Claves de idempotencia guardadas", lambda: len(self._entradas))
+
+    def _purgar(self):
+        ahora = time.monotonic()
+        for _ in range(len(self._entradas)):
+            clave, (futuro, expira, _) = next(iter(self._entradas.items()))
+            if not futuro.done():
+                # Una en curso no se puede sacar: pasa al final para no frenar la purga del resto
+                self._entradas.move_to_end(clave)
+            elif expira < ahora or len(self._entradas) > self.max_claves:
+                # Las expiradas salen; si el almacén está lleno, también las más viejas ya resueltas
+                self._entradas.popitem(last=False)
+            else:
+                break
+
+    async def ejecutar(self, clave: str, huella: str, funcion):
+        """Devuelve (resultado, repetida). Los duplicados concurrentes esperan al original.
+
+        `huella` identifica el cuerpo de la petición: la misma clave con otro cuerpo
+        lanza ClaveReutilizadaError en vez de devolver la respuesta de otra pregunta.
+        """
+        self._purgar()
+        entrada = self._entradas.get(clave)
+        if entrada is not None:
+            if entrada[2] != huella:
+                raise ClaveReutilizadaError(clave)
+            self.repeticiones.inc()
+            return await asyncio.shield(entrada[0]), True
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._entradas[clave] = (futuro, time.monotonic() + self.ttl, huella)
+        try:
+            resultado = await funcion()
+        except BaseException as e:
+            # Un fallo no se guarda: el siguiente reintento vuelve a ejecutar
+            self._entradas.pop(clave, None)
+            if isinstance(e, asyncio.CancelledError):
+                futuro.cancel()
+            else:
+                futuro.set_exception(e)
+                futuro.exception()  # evita el aviso de excepción no recuperada si nadie esperaba
+            raise
+        futuro.set_result(resultado)
+        return resultado, False
+
+
+almacen_idempotencia = AlmacenIdempotencia(IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_MAX_KEYS)
@@ -0,0 +1,196 @@
+# inference.py
+import asyncio
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from starlette.concurrency import iterate_in_threadpool
+
+from app.services import chat_logic, cliente_inferencia, intenciones
+from app.services.metricas import Indicador
+from app.services.cache import CACHE_ENABLED, cache_respuestas, normalizar_prompt
+from app.services.cache_semantico import SEMANTIC_CACHE_ENABLED, cache_semantico
+from app.services.chat_logic import obtener_respuesta
+from app.services.presupuesto import GEN_MAX_NEW_TOKENS
+
+# Configuración del ejecutor de inferencia (por variables de entorno)
+# "thread", "process" o "remote" (servidor_inferencia compartido por todos los workers)
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+INFERENCE_MAX_QUEUE = int(os.getenv("INFERENCE_MAX_QUEUE", "16"))
+INFERENCE_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "30"))
+# Respuestas precalculadas con scripts/inferencia_lote.py para llenar la caché al arrancar
+CACHE_PRELOAD_FILE = os.getenv("CACHE_PRELOAD_FILE")
+
+
+class ColaLlenaError(Exception):
+    """Hay demasiadas generaciones pendientes en el ejecutor."""
+
+
+class TiempoAgotadoError(Exception):
+    """La generación no terminó dentro de INFERENCE_TIMEOUT."""
+
+
+_executor = None
+_pendientes = 0
+
+
+def obtener_executor():
+    global _executor
+    if _executor is None:
+        if INFERENCE_EXECUTOR == "process":
+            # Cada proceso carga su propia copia del modelo. "spawn": un fork después de
+            # inicializar torch en el proceso web hereda su estado (hilos, memoria) a medias
+            _executor = ProcessPoolExecutor(
+                max_workers=INFERENCE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=INFERENCE_WORKERS, thread_name_prefix="inferencia"
+            )
+    return _executor
+
+
+def calentar_pool() -> int:
+    """Carga y calienta el modelo en cada proceso del pool; devuelve cuántos quedaron listos.
+
+    La primera carga tarda segundos, así que cada tarea la toma un proceso distinto.
+    """
+    executor = obtener_executor()
+    futuros = [executor.submit(chat_logic.preparar_proceso) for _ in range(INFERENCE_WORKERS)]
+    return len({futuro.result() for futuro in futuros})
+
+
+def pendientes() -> int:
+    return _pendientes
+
+
+Indicador("inferencia_pendientes", "Generaciones esperando o en curso en el ejecutor", pendientes)
+
+
+def buscar_en_cache(prompt: str):
+    """Primero coincidencia exacta del prompt normalizado, después por similitud."""
+    if CACHE_ENABLED:
+        respuesta = cache_respuestas.obtener(normalizar_prompt(prompt))
+        if respuesta is not None:
+            return respuesta
+    if SEMANTIC_CACHE_ENABLED:
+        respuesta = cache_semantico.buscar(prompt)
+        if respuesta is not None:
+            if CACHE_ENABLED:
+                cache_respuestas.guardar(normalizar_prompt(prompt), respuesta)
+            return respuesta
+    return None
+
+
+def guardar_en_cache(prompt: str, respuesta: str, max_new_tokens: int = GEN_MAX_NEW_TOKENS):
+    # Una respuesta recortada por carga no se guarda: se serviría aunque la carga ya bajó
+    if max_new_tokens < GEN_MAX_NEW_TOKENS:
+        return
+    if CACHE_ENABLED:
+        cache_respuestas.guardar(normalizar_prompt(prompt), respuesta)
+    if SEMANTIC_CACHE_ENABLED:
+        cache_semantico.guardar(prompt, respuesta)
+
+
+def precargar_cache(ruta: str = CACHE_PRELOAD_FILE) -> int:
+    """Carga pares prompt/respuesta de un JSONL en la caché; devuelve cuántos cargó."""
+    if not ruta or not os.path.exists(ruta):
+        return 0
+    cargadas = 0
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            try:
+                fila = json.loads(linea)
+                guardar_en_cache(fila["prompt"], fila["respuesta"])
+                cargadas += 1
+            except (ValueError, KeyError):
+                continue
+    return cargadas
+
+
+def respuesta_sin_generar(prompt: str, id_conversacion: str = None):
+    """Respuesta plantilla por intención o respuesta en caché; None si hay que generar."""
+    respuesta = intenciones.responder(prompt)
+    if respuesta is not None:
+        return respuesta
+    # Con historial la respuesta depende de los turnos previos: no se usa la caché
+    if chat_logic.contexto.tiene_historial(id_conversacion):
+        return None
+    return buscar_en_cache(prompt)
+
+
+async def generar_nueva(prompt: str, id_conversacion: str = None) -> str:
+    """Genera siempre con el modelo y guarda el resultado en la caché si no hay historial."""
+    con_historial = chat_logic.contexto.tiene_historial(id_conversacion)
+    respuesta, presupuesto = await _generar_en_executor(prompt, id_conversacion)
+    if not con_historial:
+        guardar_en_cache(prompt, respuesta, presupuesto)
+    return respuesta
+
+
+async def _generar_en_executor(prompt: str, id_conversacion: str = None):
+    """Ejecuta obtener_respuesta fuera del event loop, con límite de cola y timeout.
+
+    Devuelve (respuesta, max_new_tokens con el que se generó).
+    """
+    global _pendientes
+    if _pendientes >= INFERENCE_MAX_QUEUE:
+        raise ColaLlenaError(f"{_pendientes} generaciones pendientes")
+
+    loop = asyncio.get_running_loop()
+    _pendientes += 1
+    try:
+        if INFERENCE_EXECUTOR == "remote":
+            futuro = cliente_inferencia.generar(prompt, id_conversacion)
+        elif chat_logic.BATCH_ENABLED and INFERENCE_EXECUTOR != "process" and chat_logic.generator is not None:
+            # El micro-batcher tiene su propio hilo: no hace falta ocupar el pool.
+            # La tokenización corre en ese hilo; solo con el modelo ya cargado, para no
+            # bloquear al batcher con la carga en frío.
+            futuro = asyncio.wrap_future(chat_logic.enviar_a_lote(prompt, id_conversacion))
+        elif INFERENCE_EXECUTOR == "process":
+            # El proceso del pool tiene su propia copia (vieja) del contexto: se le mandan los turnos
+            turnos = chat_logic.contexto.turnos(id_conversacion)
+            futuro = loop.run_in_executor(
+                obtener_executor(), chat_logic.obtener_respuesta_en_proceso, prompt, id_conversacion, turnos
+            )
+        else:
+            futuro = loop.run_in_executor(obtener_executor(), obtener_respuesta, prompt, id_conversacion)
+        try:
+            return await asyncio.wait_for(futuro, timeout=INFERENCE_TIMEOUT)
+        except asyncio.TimeoutError:
+            # El hilo sigue ocupado hasta terminar, pero la petición ya no espera
+            raise TiempoAgotadoError(f"sin respuesta tras {INFERENCE_TIMEOUT}s")
+    finally:
+        _pendientes -= 1
+
+
+def cerrar_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def generar_stream(prompt: str, id_conversacion: str = None, info: dict = None):
+    """Fragmentos de la respuesta: del modelo local (en el threadpool) o del servidor remoto.
+
+    En `info` queda el max_new_tokens usado, para decidir si la respuesta va a la caché.
+    """
+    if INFERENCE_EXECUTOR == "remote":
+        async for fragmento in cliente_inferencia.generar_stream(prompt, id_conversacion, info):
+            yield fragmento
+    else:
+        async for fragmento in iterate_in_threadpool(chat_logic.generar_stream(prompt, id_conversacion, info)):
+            yield fragmento
+
+
+async def registrar_turnos(id_conversacion: str, mensaje: str, respuesta: str):
+    # El historial local decide si se usa la caché; en modo remoto el servidor arma los prompts
+    chat_logic.registrar_turnos(id_conversacion, mensaje, respuesta)
+    if INFERENCE_EXECUTOR == "remote" and id_conversacion:
+        try:
+            await cliente_inferencia.registrar_turnos(id_conversacion, mensaje, respuesta)
+        except cliente_inferencia.ErrorServidorInferencia as e:
+            print("No se pudo registrar el turno en el servidor de inferencia:", e)
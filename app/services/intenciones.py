@@ -0,0 +1,121 @@
+# intenciones.py
+import os
+import re
+import threading
+from collections import Counter
+
+from app.services.cache import normalizar_prompt
+
+# Ruta rápida: respuestas plantilla para intenciones operativas sin pasar por el LLM
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "1") == "1"
+INTENT_MIN_SCORE = int(os.getenv("INTENT_MIN_SCORE", "2"))
+INTENT_MAX_WORDS = int(os.getenv("INTENT_MAX_WORDS", "20"))
+
+# Vocabularios propios de este router, armados a partir de las preguntas de simulacion_chatbot.py.
+# Una frase vale 2 puntos y una palabra suelta 1: con INTENT_MIN_SCORE=2 una palabra sola no alcanza.
+# Fuera quedan palabras ambiguas como "recibo" ("no recibo mi pedido"), "demora" o "seguimiento".
+INTENCIONES = {
+    "tiempo_entrega": {
+        "frases": ["tiempo de entrega", "cuando llega", "cuanto tarda", "envio express", "no ha llegado",
+                   "rastrear mi pedido", "rastrear el pedido", "dias de entrega"],
+        "palabras": ["entrega", "rastrear"],
+        "respuesta": "El tiempo de entrega estándar es de 3-5 días hábiles. "
+                     "El envío express llega en 24 horas por un costo adicional.",
+    },
+    "devoluciones": {
+        "frases": ["hacer una devolucion", "quiero devolver", "quisiera devolver", "pedir un reembolso",
+                   "quiero un reembolso", "esta danado", "llego danado", "vino defectuoso"],
+        "palabras": ["devolucion", "devolver", "reembolso", "danado", "defectuoso", "reemplazo"],
+        "respuesta": "Para iniciar una devolución necesitamos tu número de pedido. "
+                     "Tienes 30 días desde la entrega para solicitarla.",
+    },
+    "factura": {
+        "frases": ["necesito factura", "necesito la factura", "factura de mi compra", "datos de facturacion"],
+        "palabras": ["factura", "facturacion", "comprobante", "rfc"],
+        "respuesta": "Puedo generarte la factura de tu compra. Indícanos tu número de pedido y tu RFC.",
+    },
+    "garantia": {
+        "frases": ["informacion sobre garantias", "informacion de la garantia", "tiene garantia",
+                   "cuanto dura la garantia"],
+        "palabras": ["garantia", "garantias"],
+        "respuesta": "Nuestros productos tienen garantía de 1 año contra defectos de fabricación.",
+    },
+}
+
+# Una coincidencia precedida por una negación cercana no cuenta ("no quiero devolver nada")
+NEGACIONES = {"no", "ni", "nunca", "jamas", "tampoco", "sin"}
+VENTANA_NEGACION = 3
+
+
+def _compilar(intenciones: dict):
+    """Una sola expresión regular con un grupo con nombre por intención y tipo (frase o palabra)."""
+    grupos = []
+    for nombre, datos in intenciones.items():
+        for tipo in ("frases", "palabras"):
+            # Las más largas primero para que ganen a sus prefijos
+            opciones = sorted(datos[tipo], key=len, reverse=True)
+            grupos.append(f"(?P<{nombre}__{tipo}>{'|'.join(re.escape(p) for p in opciones)})")
+    return re.compile(r"\b(?:" + "|".join(grupos) + r")\b")
+
+
+def _negada(normalizado: str, inicio: int) -> bool:
+    previas = normalizado[:inicio].split()[-VENTANA_NEGACION:]
+    return any(p in NEGACIONES for p in previas)
+
+
+_patron = _compilar(INTENCIONES)
+_lock = threading.Lock()
+_aciertos = Counter()
+_consultas = 0
+
+
+def clasificar(texto: str):
+    """Devuelve (intención, puntaje) si hay una única intención clara, o (None, 0)."""
+    normalizado = normalizar_prompt(texto)
+    # Mensajes largos suelen mezclar temas: mejor que los conteste el modelo
+    if len(normalizado.split()) > INTENT_MAX_WORDS:
+        return None, 0
+    puntajes = Counter()
+    for m in _patron.finditer(normalizado):
+        if _negada(normalizado, m.start()):
+            continue
+        intencion, tipo = m.lastgroup.split("__")
+        puntajes[intencion] += 2 if tipo == "frases" else 1
+    if len(puntajes) != 1:
+        return None, 0
+    intencion, puntaje = puntajes.most_common(1)[0]
+    if puntaje < INTENT_MIN_SCORE:
+        return None, 0
+    return intencion, puntaje
+
+
+def responder(texto: str):
+    """Respuesta plantilla si el mensaje es una intención de alta confianza; si no, None."""
+    global _consultas
+    if not INTENT_ROUTER_ENABLED:
+        return None
+    intencion, _ = clasificar(texto)
+    with _lock:
+        _consultas += 1
+        if intencion is not None:
+            _aciertos[intencion] += 1
+    if intencion is None:
+        return None
+    return INTENCIONES[intencion]["respuesta"]
+
+
+def estadisticas() -> dict:
+    with _lock:
+        resueltas = sum(_aciertos.values())
+        return {
+            "consultas": _consultas,
+            "resueltas_sin_llm": resueltas,
+            "tasa_sin_llm": round(resueltas / _consultas, 4) if _consultas else 0.0,
+            "por_intencion": {
+                nombre: {
+                    "aciertos": _aciertos[nombre],
+                    "tasa": round(_aciertos[nombre] / _consultas, 4) if _consultas else 0.0,
+                }
+                for nombre in INTENCIONES
+            },
+        }
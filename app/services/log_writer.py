@@ -0,0 +1,102 @@
+# log_writer.py
+import os
+import queue
+import threading
+import time
+
+from app.services import metricas
+from app.services.supabase_client import supabase
+
+# Escritura diferida (write-behind) de logs_chat en inserts masivos
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "50"))
+LOG_FLUSH_SECONDS = float(os.getenv("LOG_FLUSH_SECONDS", "1.0"))
+LOG_MAX_RETRIES = int(os.getenv("LOG_MAX_RETRIES", "3"))
+LOG_MAX_BUFFER = int(os.getenv("LOG_MAX_BUFFER", "10000"))
+
+_FIN = object()
+
+
+class EscritorLogs:
+    """Acumula filas en memoria y las inserta en bloque por tamaño o por tiempo."""
+
+    def __init__(self, tabla: str):
+        self.tabla = tabla
+        self._cola = queue.Queue(maxsize=LOG_MAX_BUFFER)
+        self._hilo = None
+        self._lock = threading.Lock()
+        self.filas_escritas = 0
+        self.filas_descartadas = 0
+
+    def registrar(self, fila: dict):
+        self._asegurar_hilo()
+        try:
+            self._cola.put_nowait(fila)
+        except queue.Full:
+            self.filas_descartadas += 1
+            print(f"Buffer de {self.tabla} lleno, se descarta una fila")
+
+    def _asegurar_hilo(self):
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name=f"escritor-{self.tabla}", daemon=True)
+                self._hilo.start()
+
+    def _bucle(self):
+        terminado = False
+        while not terminado:
+            filas = []
+            limite = time.monotonic() + LOG_FLUSH_SECONDS
+            while len(filas) < LOG_BATCH_SIZE:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    fila = self._cola.get(timeout=restante)
+                except queue.Empty:
+                    break
+                if fila is _FIN:
+                    terminado = True
+                    break
+                filas.append(fila)
+            if filas:
+                self._enviar(filas)
+
+        # Vaciar lo que haya quedado en el buffer antes de salir
+        restantes = []
+        while True:
+            try:
+                fila = self._cola.get_nowait()
+            except queue.Empty:
+                break
+            if fila is not _FIN:
+                restantes.append(fila)
+        for i in range(0, len(restantes), LOG_BATCH_SIZE):
+            self._enviar(restantes[i:i + LOG_BATCH_SIZE])
+
+    def _enviar(self, filas: list):
+        for intento in range(LOG_MAX_RETRIES):
+            operacion = f"insert_{self.tabla}"
+            try:
+                with metricas.medir(metricas.supabase_latencia, operacion=operacion):
+                    supabase.table(self.tabla).insert(filas).execute()
+                self.filas_escritas += len(filas)
+                return
+            except Exception as e:
+                metricas.supabase_errores.inc(operacion=operacion)
+                print(f"Error al insertar en Supabase (intento {intento + 1}/{LOG_MAX_RETRIES}):", e)
+                time.sleep(0.5 * 2 ** intento)
+        self.filas_descartadas += len(filas)
+        print(f"Se pierden {len(filas)} filas de {self.tabla} tras {LOG_MAX_RETRIES} intentos")
+
+    def detener(self, timeout: float = 10):
+        """Vacía el buffer y espera a que terminen los inserts pendientes."""
+        with self._lock:
+            hilo = self._hilo
+            self._hilo = None
+        if hilo is None:
+            return
+        self._cola.put(_FIN)
+        hilo.join(timeout)
+
+
+escritor_logs = EscritorLogs("logs_chat")
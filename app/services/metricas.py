@@ -0,0 +1,154 @@
+# metricas.py
+import threading
+import time
+from contextlib import contextmanager
+
+# Métricas en memoria, exportadas en formato de texto de Prometheus en /metrics
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registro = []
+
+
+def _etiquetas(claves: tuple, valores: tuple, extra: str = "") -> str:
+    partes = [f'{k}="{v}"' for k, v in zip(claves, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+class Contador:
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self._valores = {}
+        self._lock = threading.Lock()
+        _registro.append(self)
+
+    def inc(self, valor: float = 1, **etiquetas):
+        clave = tuple(str(etiquetas.get(k, "")) for k in self.etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def valor(self, **etiquetas) -> float:
+        clave = tuple(str(etiquetas.get(k, "")) for k in self.etiquetas)
+        return self._valores.get(clave, 0)
+
+    def exportar(self) -> list:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with self._lock:
+            for clave, valor in self._valores.items():
+                lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {valor}")
+        return lineas
+
+
+class Indicador:
+    """Gauge cuyo valor se lee en el momento de exportar."""
+
+    def __init__(self, nombre: str, ayuda: str, funcion):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+        _registro.append(self)
+
+    def exportar(self) -> list:
+        return [
+            f"# HELP {self.nombre} {self.ayuda}",
+            f"# TYPE {self.nombre} gauge",
+            f"{self.nombre} {self.funcion()}",
+        ]
+
+
+class Histograma:
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = (), buckets: tuple = BUCKETS_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.buckets = tuple(buckets)
+        self._series = {}  # etiquetas -> [conteos por bucket (+Inf al final), suma, total]
+        self._lock = threading.Lock()
+        _registro.append(self)
+
+    def observar(self, valor: float, **etiquetas):
+        clave = tuple(str(etiquetas.get(k, "")) for k in self.etiquetas)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            else:
+                serie[0][-1] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def resumen(self) -> dict:
+        """Buckets acumulados de todas las series, para las vistas JSON."""
+        with self._lock:
+            conteos = [0] * (len(self.buckets) + 1)
+            suma = 0.0
+            total = 0
+            for serie in self._series.values():
+                conteos = [a + b for a, b in zip(conteos, serie[0])]
+                suma += serie[1]
+                total += serie[2]
+        buckets = {}
+        acumulado = 0
+        for limite, conteo in zip(list(self.buckets) + ["+Inf"], conteos):
+            acumulado += conteo
+            buckets[str(limite)] = acumulado
+        return {"buckets": buckets, "suma": round(suma, 6), "total": total}
+
+    def exportar(self) -> list:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            for clave, (conteos, suma, total) in self._series.items():
+                acumulado = 0
+                for limite, conteo in zip(list(self.buckets) + ["+Inf"], conteos):
+                    acumulado += conteo
+                    le = _etiquetas(self.etiquetas, clave, f'le="{limite}"')
+                    lineas.append(f"{self.nombre}_bucket{le} {acumulado}")
+                lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {suma}")
+                lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {total}")
+        return lineas
+
+
+@contextmanager
+def medir(histograma: Histograma, **etiquetas):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        histograma.observar(time.perf_counter() - inicio, **etiquetas)
+
+
+def exportar() -> str:
+    lineas = []
+    for metrica in _registro:
+        lineas.extend(metrica.exportar())
+    return "\n".join(lineas) + "\n"
+
+
+# Métricas compartidas por la app
+peticiones_http = Histograma(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta", ("metodo", "ruta", "status")
+)
+etapas_chat = Histograma("chat_etapa_duracion_segundos", "Duración de cada etapa de /chat/", ("etapa",))
+inferencia = Histograma("inferencia_duracion_segundos", "Latencia de generación del modelo", ("modo",))
+tokens_entrada = Contador("tokens_entrada_total", "Tokens de entrada procesados por el modelo")
+tokens_generados = Contador("tokens_generados_total", "Tokens generados por el modelo")
+tamano_lote = Histograma(
+    "inferencia_tamano_lote", "Prompts por llamada al modelo", buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+supabase_latencia = Histograma("supabase_duracion_segundos", "Latencia de las llamadas a Supabase", ("operacion",))
+supabase_errores = Contador("supabase_errores_total", "Errores en llamadas a Supabase", ("operacion",))
+tokens_reales_lote = Contador("lote_tokens_reales_total", "Tokens de entrada reales en los lotes")
+tokens_con_relleno_lote = Contador("lote_tokens_con_relleno_total", "Tokens de entrada de los lotes incluyendo padding")
+eficiencia_relleno = Histograma(
+    "lote_eficiencia_relleno", "Fracción de tokens reales (no padding) por lote",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0),
+)
+lotes_por_bucket = Contador("lotes_por_bucket_total", "Lotes generados por bucket de longitud", ("bucket",))
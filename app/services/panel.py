@@ -0,0 +1,51 @@
+# panel.py
+import os
+
+from app.services import clustering, metricas
+from app.services.supabase_client import supabase
+
+# Datos que consulta /panel
+PANEL_LOGS_LIMIT = int(os.getenv("PANEL_LOGS_LIMIT", "100"))
+SEGMENTACION_MAX_FILAS = int(os.getenv("SEGMENTACION_MAX_FILAS", "5000"))
+PREDICCION_SESIONES = int(os.getenv("PREDICCION_SESIONES", "10"))
+
+
+def _consultar(operacion: str, consulta):
+    try:
+        with metricas.medir(metricas.supabase_latencia, operacion=operacion):
+            return consulta.execute().data
+    except Exception:
+        metricas.supabase_errores.inc(operacion=operacion)
+        raise
+
+
+def leer_logs(cursor: int = None, limit: int = PANEL_LOGS_LIMIT) -> list:
+    """Filas de logs_chat con id mayor que `cursor` (en orden), o las últimas `limit` si no hay cursor.
+
+    El cursor es el id que asigna la base al insertar, no la fecha del log: la fecha se pone
+    en guardar_log y la fila puede llegar a Supabase más tarde (escritura diferida, varios workers).
+    Requiere que logs_chat.id sea un entero creciente (bigint identity / serial), no un uuid:
+    guardar_log no envía id, así que lo asigna siempre la base.
+    """
+    if cursor is not None:
+        consulta = supabase.table("logs_chat").select("*").gt("id", cursor).order("id").limit(limit)
+        return _consultar("select_logs_chat", consulta)
+    consulta = supabase.table("logs_chat").select("*").order("id", desc=True).limit(limit)
+    return list(reversed(_consultar("select_logs_chat", consulta)))
+
+
+def sesiones_recientes() -> list:
+    """Features por conversación a partir de las filas más recientes de logs_chat."""
+    filas = leer_logs(limit=SEGMENTACION_MAX_FILAS)
+    return clustering.calcular_features_sesiones(filas)
+
+
+def vistas() -> dict:
+    """Segmentación y predicción de las sesiones más recientes, con una sola lectura y un solo predict."""
+    sesiones = sesiones_recientes()
+    segmentacion = clustering.segmentar_sesiones(sesiones)
+    recientes = sorted(sesiones, key=lambda s: s["ultima_actividad"], reverse=True)
+    return {
+        "segmentacion": segmentacion,
+        "prediccion": {"sesiones": recientes[:PREDICCION_SESIONES]},
+    }
@@ -0,0 +1,90 @@
+# presupuesto.py
+import os
+import threading
+import time
+from collections import deque
+
+from app.services.metricas import Contador, Indicador
+
+# Presupuesto de generación adaptativo: menos tokens cuando hay carga, el máximo cuando no
+GEN_MAX_NEW_TOKENS = int(os.getenv("GEN_MAX_NEW_TOKENS", "60"))
+GEN_MIN_NEW_TOKENS = int(os.getenv("GEN_MIN_NEW_TOKENS", "20"))
+GEN_TOKENS_STEP = int(os.getenv("GEN_TOKENS_STEP", "10"))
+# Umbrales de presión: por debajo de *_LOW no se recorta, a partir de *_HIGH se usa el mínimo
+GEN_QUEUE_LOW = int(os.getenv("GEN_QUEUE_LOW", "2"))
+GEN_QUEUE_HIGH = int(os.getenv("GEN_QUEUE_HIGH", "16"))
+GEN_P95_LOW = float(os.getenv("GEN_P95_LOW", "2.0"))
+GEN_P95_HIGH = float(os.getenv("GEN_P95_HIGH", "8.0"))
+GEN_LATENCY_WINDOW = int(os.getenv("GEN_LATENCY_WINDOW", "100"))
+
+
+def _presion(valor: float, bajo: float, alto: float) -> float:
+    if alto <= bajo:
+        return 0.0
+    return min(max((valor - bajo) / (alto - bajo), 0.0), 1.0)
+
+
+class PoliticaPresupuesto:
+    def __init__(self):
+        self._latencias = deque(maxlen=GEN_LATENCY_WINDOW)
+        self._fuentes_cola = []
+        self._lock = threading.Lock()
+        self.actual = (GEN_MAX_NEW_TOKENS, False)
+        self.decisiones = deque(maxlen=50)  # últimos cambios de presupuesto, para auditar
+        self.cambios = Contador("presupuesto_cambios_total", "Cambios del presupuesto de generación", ("max_new_tokens",))
+        Indicador("presupuesto_max_new_tokens", "max_new_tokens vigente", lambda: self.actual[0])
+
+    def agregar_fuente_cola(self, funcion):
+        """Registra una función que devuelve cuántas peticiones esperan en alguna cola."""
+        self._fuentes_cola.append(funcion)
+
+    def registrar_latencia(self, segundos: float):
+        with self._lock:
+            self._latencias.append(segundos)
+
+    def p95(self) -> float:
+        with self._lock:
+            ordenadas = sorted(self._latencias)
+        if not ordenadas:
+            return 0.0
+        return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))]
+
+    def decidir(self):
+        """Devuelve (max_new_tokens, cortar_en_oracion) según la cola y el p95 recientes."""
+        cola = sum(f() for f in self._fuentes_cola)
+        p95 = self.p95()
+        presion = max(_presion(cola, GEN_QUEUE_LOW, GEN_QUEUE_HIGH), _presion(p95, GEN_P95_LOW, GEN_P95_HIGH))
+
+        tokens = GEN_MAX_NEW_TOKENS - presion * (GEN_MAX_NEW_TOKENS - GEN_MIN_NEW_TOKENS)
+        # Escalones fijos: evita cambiar el presupuesto con cada petición
+        tokens = max(GEN_MIN_NEW_TOKENS, int(round(tokens / GEN_TOKENS_STEP) * GEN_TOKENS_STEP))
+        decision = (tokens, presion > 0)
+
+        with self._lock:
+            if decision != self.actual:
+                registro = {
+                    "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "cola": cola,
+                    "p95_s": round(p95, 3),
+                    "antes": self.actual[0],
+                    "max_new_tokens": tokens,
+                    "cortar_en_oracion": decision[1],
+                }
+                self.decisiones.append(registro)
+                self.cambios.inc(max_new_tokens=tokens)
+                print("Presupuesto de generación:", registro)
+                self.actual = decision
+        return decision
+
+    def estadisticas(self) -> dict:
+        return {
+            "max_new_tokens": self.actual[0],
+            "cortar_en_oracion": self.actual[1],
+            "p95_s": round(self.p95(), 3),
+            "cola": sum(f() for f in self._fuentes_cola),
+            "limites": {"min": GEN_MIN_NEW_TOKENS, "max": GEN_MAX_NEW_TOKENS},
+            "decisiones": list(self.decisiones),
+        }
+
+
+politica = PoliticaPresupuesto()
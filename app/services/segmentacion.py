@@ -0,0 +1,76 @@
+# segmentacion.py
+import hashlib
+import json
+import os
+import threading
+import time
+
+from app.services import panel
+from app.services.metricas import Contador
+
+# Las vistas del panel (segmentación y predicción) se recalculan como mucho cada SEGMENTACION_MIN_SECONDS
+# si hubo mensajes nuevos, y al menos cada SEGMENTACION_MAX_SECONDS aunque no los haya
+# (otros workers también escriben en logs_chat)
+SEGMENTACION_MIN_SECONDS = float(os.getenv("SEGMENTACION_MIN_SECONDS", "10"))
+SEGMENTACION_MAX_SECONDS = float(os.getenv("SEGMENTACION_MAX_SECONDS", "300"))
+
+
+class InstantaneaSegmentacion:
+    """Último resultado de panel.vistas() ya serializado, con un ETag por vista."""
+
+    def __init__(self, min_segundos: float, max_segundos: float):
+        self.min_segundos = min_segundos
+        self.max_segundos = max_segundos
+        # vista -> (cuerpo, etag); el dict entero se reemplaza de una vez y nunca se mezclan versiones
+        self.vigente = None
+        self.calculada_en = 0.0
+        self.sucia = True
+        self._lock = threading.Lock()
+        self.recalculos = Contador("segmentacion_recalculos_total", "Recálculos de la segmentación", ("resultado",))
+
+    def marcar_sucia(self):
+        # Solo levanta la bandera: el recálculo lo hace la próxima consulta
+        self.sucia = True
+
+    def _vencida(self) -> bool:
+        edad = time.monotonic() - self.calculada_en
+        return edad >= self.max_segundos or (self.sucia and edad >= self.min_segundos)
+
+    def _recalcular(self):
+        self.sucia = False
+        try:
+            datos = panel.vistas()
+        except Exception:
+            self.sucia = True
+            self.recalculos.inc(resultado="error")
+            raise
+        vigente = {}
+        for vista, contenido in datos.items():
+            # Orden de claves fijo: mismo contenido, mismo ETag
+            cuerpo = json.dumps(contenido, sort_keys=True, ensure_ascii=False).encode("utf-8")
+            vigente[vista] = (cuerpo, '"' + hashlib.sha256(cuerpo).hexdigest() + '"')
+        self.vigente = vigente
+        self.calculada_en = time.monotonic()
+        self.recalculos.inc(resultado="ok")
+
+    def obtener(self, vista: str = "segmentacion"):
+        """(cuerpo, etag) vigentes de la vista, recalculando si corresponde."""
+        vigente = self.vigente
+        if vigente is None or self._vencida():
+            # Si otro hilo ya está recalculando y hay una versión previa, se sirve esa
+            if self._lock.acquire(blocking=vigente is None):
+                try:
+                    if self.vigente is None or self._vencida():
+                        try:
+                            self._recalcular()
+                        except Exception as e:
+                            if self.vigente is None:
+                                raise
+                            print("Error recalculando la segmentación, se sirve la anterior:", e)
+                finally:
+                    self._lock.release()
+                vigente = self.vigente
+        return vigente[vista]
+
+
+instantanea_segmentacion = InstantaneaSegmentacion(SEGMENTACION_MIN_SECONDS, SEGMENTACION_MAX_SECONDS)
@@ -0,0 +1,113 @@
+# servidor_inferencia.py
+"""
+Servidor de inferencia local: un solo proceso carga el modelo y atiende a todos
+los workers web (INFERENCE_EXECUTOR=remote) por socket Unix o TCP local.
+
+Protocolo: cada mensaje es un JSON UTF-8 precedido por su longitud (4 bytes, big-endian).
+
+    python -m app.services.servidor_inferencia
+"""
+import asyncio
+import json
+import os
+import struct
+
+INFERENCE_SERVER_ADDRESS = os.getenv("INFERENCE_SERVER_ADDRESS", "unix:/tmp/ecommerce_inferencia.sock")
+
+_CABECERA = struct.Struct(">I")
+
+
+async def leer_mensaje(reader: asyncio.StreamReader) -> dict:
+    (longitud,) = _CABECERA.unpack(await reader.readexactly(_CABECERA.size))
+    return json.loads(await reader.readexactly(longitud))
+
+
+async def escribir_mensaje(writer: asyncio.StreamWriter, mensaje: dict):
+    datos = json.dumps(mensaje, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    writer.write(_CABECERA.pack(len(datos)) + datos)
+    await writer.drain()
+
+
+def parsear_direccion(direccion: str):
+    """'unix:/ruta.sock' o 'tcp:host:puerto'."""
+    tipo, _, resto = direccion.partition(":")
+    if tipo == "unix":
+        return "unix", resto
+    host, _, puerto = resto.rpartition(":")
+    return "tcp", (host, int(puerto))
+
+
+async def _atender_generar(writer, mensaje: dict):
+    from app.services import chat_logic
+
+    # Todas las peticiones de todos los workers pasan por el mismo micro-batcher
+    respuesta, presupuesto = await asyncio.wrap_future(
+        chat_logic.enviar_a_lote(mensaje["prompt"], mensaje.get("id_conversacion"))
+    )
+    await escribir_mensaje(writer, {"ok": True, "respuesta": respuesta, "max_new_tokens": presupuesto})
+
+
+async def _atender_stream(writer, mensaje: dict):
+    from starlette.concurrency import iterate_in_threadpool
+
+    from app.services import chat_logic
+
+    info = {}
+    fragmentos = chat_logic.generar_stream(mensaje["prompt"], mensaje.get("id_conversacion"), info)
+    async for fragmento in iterate_in_threadpool(fragmentos):
+        await escribir_mensaje(writer, {"token": fragmento})
+    await escribir_mensaje(writer, {"ok": True, "fin": True, "max_new_tokens": info.get("max_new_tokens")})
+
+
+async def atender(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    from app.services import chat_logic
+
+    try:
+        while True:
+            try:
+                mensaje = await leer_mensaje(reader)
+            except asyncio.IncompleteReadError:
+                break
+            op = mensaje.get("op")
+            try:
+                if op == "generar":
+                    await _atender_generar(writer, mensaje)
+                elif op == "stream":
+                    await _atender_stream(writer, mensaje)
+                elif op == "turnos":
+                    chat_logic.registrar_turnos(mensaje["id_conversacion"], mensaje["mensaje"], mensaje["respuesta"])
+                    await escribir_mensaje(writer, {"ok": True})
+                elif op == "ping":
+                    await escribir_mensaje(writer, {"ok": True, "listo": chat_logic.generator is not None})
+                else:
+                    await escribir_mensaje(writer, {"ok": False, "error": f"operación desconocida: {op}"})
+            except (ConnectionError, asyncio.IncompleteReadError):
+                break
+            except Exception as e:
+                print("Error atendiendo petición de inferencia:", e)
+                await escribir_mensaje(writer, {"ok": False, "error": str(e)})
+    finally:
+        writer.close()
+
+
+async def servir():
+    from app.services import chat_logic
+
+    print("Cargando modelo...")
+    chat_logic.cargar_modelo()
+    chat_logic.calentar()
+
+    tipo, destino = parsear_direccion(INFERENCE_SERVER_ADDRESS)
+    if tipo == "unix":
+        if os.path.exists(destino):
+            os.remove(destino)
+        servidor = await asyncio.start_unix_server(atender, path=destino)
+    else:
+        servidor = await asyncio.start_server(atender, host=destino[0], port=destino[1])
+    print(f"Servidor de inferencia escuchando en {INFERENCE_SERVER_ADDRESS}")
+    async with servidor:
+        await servidor.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(servir())
@@ -0,0 +1,88 @@
+# sesiones.py
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app.services import clustering
+from app.services.metricas import Indicador
+
+# Features de clustering de cada conversación en curso, actualizadas con cada mensaje
+SESIONES_MAX = int(os.getenv("SESIONES_MAX", "10000"))
+SESIONES_IDLE_SECONDS = float(os.getenv("SESIONES_IDLE_SECONDS", "1800"))
+
+
+class SeguimientoSesiones:
+    """Lo mismo que calcular_features_sesiones, pero incremental y sin leer logs_chat."""
+
+    def __init__(self, max_sesiones: int, idle: float):
+        self.max_sesiones = max_sesiones
+        self.idle = idle
+        # id_conversacion -> sesión; la menos activa queda al principio
+        self._sesiones = OrderedDict()
+        self._lock = threading.Lock()
+        Indicador("sesiones_en_seguimiento", "Conversaciones con features en memoria", lambda: len(self._sesiones))
+
+    def _desalojar(self, ahora: float):
+        # Se desaloja por el frente: ahí están las sesiones inactivas hace más tiempo
+        while self._sesiones:
+            sesion = next(iter(self._sesiones.values()))
+            if len(self._sesiones) <= self.max_sesiones and ahora - sesion["ultimo"] < self.idle:
+                break
+            self._sesiones.popitem(last=False)
+
+    def registrar(self, id_conversacion: str, id_usuario: str, instante: float = None):
+        ahora = instante if instante is not None else time.time()
+        with self._lock:
+            sesion = self._sesiones.get(id_conversacion)
+            if sesion is None:
+                sesion = {"id_usuario": id_usuario, "mensajes": 0, "inicio": ahora, "ultimo": ahora, "cluster": None}
+                self._sesiones[id_conversacion] = sesion
+            sesion["mensajes"] += 1
+            sesion["ultimo"] = max(sesion["ultimo"], ahora)
+            sesion["cluster"] = None  # cambió la sesión: se vuelve a predecir al leerla
+            self._sesiones.move_to_end(id_conversacion)
+            self._desalojar(ahora)
+
+    def features(self, id_conversacion: str):
+        """Features de la sesión con el mismo formato que calcular_features_sesiones, o None."""
+        with self._lock:
+            sesion = self._sesiones.get(id_conversacion)
+            if sesion is None:
+                return None
+            # Inactiva de más: se desaloja aquí también, sin esperar al próximo registrar()
+            if time.time() - sesion["ultimo"] >= self.idle:
+                del self._sesiones[id_conversacion]
+                return None
+            return {
+                "id_conversacion": id_conversacion,
+                "id_usuario": sesion["id_usuario"],
+                "mensajes_totales": sesion["mensajes"],
+                "duracion_sesion": sesion["ultimo"] - sesion["inicio"],
+                "interacciones": sesion["mensajes"],
+                "cluster": sesion["cluster"],
+            }
+
+    def cluster(self, id_conversacion: str):
+        """Features y cluster actual; la predicción se guarda hasta el próximo mensaje.
+
+        Con menos de MIN_MENSAJES_SESION mensajes el cluster queda en None, como en la
+        segmentación (calcular_features_sesiones excluye esas sesiones).
+        """
+        datos = self.features(id_conversacion)
+        if datos is None or datos["cluster"] is not None:
+            return datos
+        if datos["mensajes_totales"] < clustering.MIN_MENSAJES_SESION:
+            return datos
+        datos["cluster"] = clustering.predict_cluster(
+            datos["mensajes_totales"], datos["duracion_sesion"], datos["interacciones"]
+        )
+        with self._lock:
+            sesion = self._sesiones.get(id_conversacion)
+            # Solo si no llegó otro mensaje mientras se predecía
+            if sesion is not None and sesion["mensajes"] == datos["mensajes_totales"]:
+                sesion["cluster"] = datos["cluster"]
+        return datos
+
+
+seguimiento_sesiones = SeguimientoSesiones(SESIONES_MAX, SESIONES_IDLE_SECONDS)
@@ -0,0 +1,49 @@
+# single_flight.py
+import asyncio
+
+from app.services.metricas import Contador, Indicador
+
+
+class SingleFlight:
+    """Mientras hay una ejecución en curso para una clave, las llamadas iguales esperan su resultado."""
+
+    def __init__(self, nombre: str):
+        self._en_vuelo = {}  # clave -> asyncio.Future
+        self.coalescidas = Contador(f"{nombre}_coalescidas_total", "Peticiones servidas por una ejecución ya en curso")
+        self.ejecuciones = Contador(f"{nombre}_ejecuciones_total", "Ejecuciones reales iniciadas")
+        Indicador(f"{nombre}_en_vuelo", "Claves con una ejecución en curso", lambda: len(self._en_vuelo))
+
+    async def ejecutar(self, clave: str, funcion):
+        futuro = self._en_vuelo.get(clave)
+        if futuro is not None:
+            self.coalescidas.inc()
+            # shield: si esta petición se cancela, la ejecución compartida sigue
+            return await asyncio.shield(futuro)
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._en_vuelo[clave] = futuro
+        self.ejecuciones.inc()
+        try:
+            resultado = await funcion()
+        except asyncio.CancelledError:
+            futuro.cancel()
+            raise
+        except Exception as e:
+            futuro.set_exception(e)
+            futuro.exception()  # evita el aviso de excepción no recuperada si nadie esperaba
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado
+        finally:
+            del self._en_vuelo[clave]
+
+    def estadisticas(self) -> dict:
+        return {
+            "en_vuelo": len(self._en_vuelo),
+            "ejecuciones": self.ejecuciones.valor(),
+            "coalescidas": self.coalescidas.valor(),
+        }
+
+
+generaciones = SingleFlight("generacion")
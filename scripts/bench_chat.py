@@ -0,0 +1,263 @@
+# bench_chat.py
+"""
+Benchmark de /chat/ sin red ni modelo: levanta app.main en proceso con un generador
+falso de latencia fija y un Supabase en memoria, y lo carga con distintos patrones.
+
+    python scripts/bench_chat.py --patron cerrado --concurrencia 32 --peticiones 500
+    python scripts/bench_chat.py --patron poisson --tasa 50 --duracion 20 --latencia-ms 80
+    python scripts/bench_chat.py --patron rafaga --rafaga 64 --intervalo 2 --duracion 10
+
+Imprime un JSON con p50/p95/p99, throughput y errores por status.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import types
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+PROMPTS = [
+    "Hola, necesito ayuda con un producto",
+    "¿Tienen este artículo en stock?",
+    "Quisiera hacer una devolución",
+    "¿Cuál es el tiempo de entrega?",
+    "Necesito información sobre garantías",
+    "¿Ofrecen descuentos por cantidad?",
+    "Mi pedido no ha llegado todavía",
+    "¿Hacen envíos internacionales?",
+    "El producto que recibí está dañado",
+]
+
+
+class ConsultaEnMemoria:
+    """Lo mínimo del query builder de supabase-py que usa la app."""
+
+    def __init__(self, tabla: "TablaEnMemoria"):
+        self.tabla = tabla
+        self._insertar = None
+        self._filtros = []
+        self._orden = None
+        self._limite = None
+
+    def insert(self, filas):
+        self._insertar = filas if isinstance(filas, list) else [filas]
+        return self
+
+    def select(self, *_):
+        return self
+
+    def gt(self, columna, valor):
+        self._filtros.append(lambda fila: fila.get(columna) is not None and fila[columna] > valor)
+        return self
+
+    def order(self, columna, desc=False):
+        self._orden = (columna, desc)
+        return self
+
+    def limit(self, n):
+        self._limite = n
+        return self
+
+    def execute(self):
+        with self.tabla.lock:
+            if self._insertar is not None:
+                for fila in self._insertar:
+                    self.tabla.filas.append({"id": len(self.tabla.filas) + 1, **fila})
+                return types.SimpleNamespace(data=self._insertar)
+            filas = [f for f in self.tabla.filas if all(filtro(f) for filtro in self._filtros)]
+        if self._orden:
+            columna, desc = self._orden
+            filas.sort(key=lambda fila: fila.get(columna) or "", reverse=desc)
+        if self._limite is not None:
+            filas = filas[:self._limite]
+        return types.SimpleNamespace(data=filas)
+
+
+class TablaEnMemoria:
+    def __init__(self):
+        self.filas = []
+        self.lock = threading.Lock()
+
+
+class SupabaseEnMemoria:
+    def __init__(self):
+        self.tablas = {}
+
+    def table(self, nombre: str):
+        return ConsultaEnMemoria(self.tablas.setdefault(nombre, TablaEnMemoria()))
+
+
+def preparar_app(latencia_ms: float, con_cache: bool):
+    """Importa app.main con Supabase en memoria y un generador falso."""
+    if not con_cache:
+        os.environ.setdefault("CACHE_ENABLED", "0")
+        os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "0")
+        os.environ.setdefault("INTENT_ROUTER_ENABLED", "0")
+
+    supabase = SupabaseEnMemoria()
+    sys.modules["app.services.supabase_client"] = types.SimpleNamespace(supabase=supabase)
+
+    from app.services import chat_logic, clustering
+
+    def generar_lote(entradas, max_new_tokens=None):
+        # Un lote cuesta lo mismo que una petición: así se ve el efecto del micro-batching
+        time.sleep(latencia_ms / 1000)
+        respuestas = [f"Respuesta simulada #{i}" for i in range(len(entradas))]
+        return respuestas, max_new_tokens or chat_logic.MAX_NEW_TOKENS
+
+    def generar_stream(prompt, id_conversacion=None, info=None):
+        if info is not None:
+            info["max_new_tokens"] = chat_logic.MAX_NEW_TOKENS
+        for palabra in "Respuesta simulada en streaming".split():
+            time.sleep(latencia_ms / 1000 / 4)
+            yield palabra + " "
+
+    # Como si el modelo ya estuviera cargado: la inferencia va directa al micro-batcher
+    chat_logic.generator = object()
+    chat_logic.cargar_modelo = lambda: chat_logic.generator
+    chat_logic.calentar = lambda: None
+    chat_logic.construir_ids = lambda prompt, id_conversacion=None: [0] * len(prompt.split())
+    chat_logic.generar_lote = generar_lote
+    chat_logic.generar_stream = generar_stream
+    clustering.cargar_modelos = lambda: None
+
+    from app.main import app
+
+    return app, supabase
+
+
+async def una_peticion(cliente, resultados: list, prompts_unicos: bool):
+    prompt = random.choice(PROMPTS)
+    if prompts_unicos:
+        prompt = f"{prompt} ({uuid.uuid4().hex[:8]})"
+    inicio = time.perf_counter()
+    try:
+        respuesta = await cliente.post("/chat/", json={"user_id": "bench", "message": prompt})
+        status = respuesta.status_code
+    except Exception as e:
+        status = type(e).__name__
+    resultados.append((status, time.perf_counter() - inicio))
+
+
+async def patron_cerrado(cliente, args, resultados):
+    # N clientes que envían la siguiente petición en cuanto reciben la anterior
+    restantes = iter(range(args.peticiones))
+
+    async def usuario():
+        for _ in restantes:
+            await una_peticion(cliente, resultados, args.prompts_unicos)
+
+    await asyncio.gather(*(usuario() for _ in range(args.concurrencia)))
+
+
+async def patron_poisson(cliente, args, resultados):
+    # Llegadas abiertas con tasa media fija, independientes de las respuestas
+    tareas = []
+    fin = time.perf_counter() + args.duracion
+    while time.perf_counter() < fin:
+        tareas.append(asyncio.create_task(una_peticion(cliente, resultados, args.prompts_unicos)))
+        await asyncio.sleep(random.expovariate(args.tasa))
+    await asyncio.gather(*tareas)
+
+
+async def patron_rafaga(cliente, args, resultados):
+    tareas = []
+    fin = time.perf_counter() + args.duracion
+    while time.perf_counter() < fin:
+        for _ in range(args.rafaga):
+            tareas.append(asyncio.create_task(una_peticion(cliente, resultados, args.prompts_unicos)))
+        await asyncio.sleep(args.intervalo)
+    await asyncio.gather(*tareas)
+
+
+PATRONES = {"cerrado": patron_cerrado, "poisson": patron_poisson, "rafaga": patron_rafaga}
+
+
+def percentil(ordenados: list, p: float) -> float:
+    if not ordenados:
+        return 0.0
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def informe(resultados: list, segundos: float, args, supabase) -> dict:
+    latencias_ok = sorted(lat for status, lat in resultados if status == 200)
+    por_status = {}
+    for status, _ in resultados:
+        por_status[str(status)] = por_status.get(str(status), 0) + 1
+    errores = len(resultados) - len(latencias_ok)
+    return {
+        "patron": args.patron,
+        "config": {k: v for k, v in vars(args).items() if k not in ("salida",)},
+        "peticiones": len(resultados),
+        "duracion_s": round(segundos, 3),
+        "throughput_rps": round(len(latencias_ok) / segundos, 2) if segundos else 0.0,
+        "latencia_s": {
+            "p50": round(percentil(latencias_ok, 0.50), 4),
+            "p95": round(percentil(latencias_ok, 0.95), 4),
+            "p99": round(percentil(latencias_ok, 0.99), 4),
+            "media": round(statistics.mean(latencias_ok), 4) if latencias_ok else 0.0,
+            "max": round(latencias_ok[-1], 4) if latencias_ok else 0.0,
+        },
+        "errores": errores,
+        "tasa_error": round(errores / len(resultados), 4) if resultados else 0.0,
+        "por_status": por_status,
+        "filas_logs_chat": len(supabase.table("logs_chat").tabla.filas),
+    }
+
+
+async def ejecutar(args) -> dict:
+    import httpx
+
+    app, supabase = preparar_app(args.latencia_ms, args.con_cache)
+    await app.router.startup()
+    try:
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=None) as cliente:
+            resultados = []
+            inicio = time.perf_counter()
+            await PATRONES[args.patron](cliente, args, resultados)
+            segundos = time.perf_counter() - inicio
+    finally:
+        # Vacía el escritor de logs para contar las filas escritas
+        await app.router.shutdown()
+    return informe(resultados, segundos, args, supabase)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patron", choices=sorted(PATRONES), default="cerrado")
+    parser.add_argument("--latencia-ms", type=float, default=50, help="Latencia fija del generador falso por lote")
+    parser.add_argument("--concurrencia", type=int, default=16, help="Clientes simultáneos (patrón cerrado)")
+    parser.add_argument("--peticiones", type=int, default=200, help="Total de peticiones (patrón cerrado)")
+    parser.add_argument("--tasa", type=float, default=20, help="Peticiones por segundo (patrón poisson)")
+    parser.add_argument("--rafaga", type=int, default=32, help="Peticiones por ráfaga (patrón rafaga)")
+    parser.add_argument("--intervalo", type=float, default=1.0, help="Segundos entre ráfagas (patrón rafaga)")
+    parser.add_argument("--duracion", type=float, default=10, help="Segundos de carga (poisson y rafaga)")
+    parser.add_argument("--con-cache", action="store_true", help="No desactivar cachés ni ruta por intención")
+    parser.add_argument(
+        "--prompts-unicos", action=argparse.BooleanOptionalAction, default=True,
+        help="Sufijo único por prompt (por defecto). Con --no-prompts-unicos los prompts iguales "
+             "en vuelo se fusionan en una sola generación (single-flight)",
+    )
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", help="Ruta donde guardar el JSON")
+    args = parser.parse_args()
+
+    random.seed(args.semilla)
+    resultado = asyncio.run(ejecutar(args))
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    print(texto)
+
+
+if __name__ == "__main__":
+    main()
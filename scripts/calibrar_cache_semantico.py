@@ -0,0 +1,100 @@
+# calibrar_cache_semantico.py
+"""
+Calibra SEMANTIC_CACHE_THRESHOLD: paráfrasis que deberían acertar y casi-iguales que no.
+
+    python scripts/calibrar_cache_semantico.py [--salida informe.json]
+
+Las preguntas base son las de chatbot_produccion/simulacion_chatbot.py.
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.cache_semantico import CacheSemantico, palabras_criticas
+
+# (pregunta guardada, pregunta nueva): deberían compartir respuesta
+PARAFRASIS = [
+    ("¿Cuál es el tiempo de entrega?", "¿Cuánto tarda la entrega?"),
+    ("¿Cuál es el tiempo de entrega?", "cual es el tiempo de entrega"),
+    ("¿Cuál es el tiempo de entrega?", "¿cuál es el tiempo de entrega de un pedido?"),
+    ("¿Hacen envíos internacionales?", "¿Hacen envíos a otros países?"),
+    ("¿Hacen envíos internacionales?", "hacen envio internacional"),
+    ("¿Tienen este artículo en stock?", "¿tienen este articulo en stock"),
+    ("¿Tienen este artículo en stock?", "¿Este artículo está en stock?"),
+    ("Quisiera hacer una devolución", "quiero hacer una devolucion"),
+    ("Quisiera hacer una devolución", "quisiera hacer la devolución de un producto"),
+    ("Necesito información sobre garantías", "información sobre la garantía"),
+    ("¿Ofrecen descuentos por cantidad?", "¿hay descuentos por cantidad?"),
+    ("¿Cómo funciona el envío express?", "como funciona el envio express"),
+    ("¿Cómo funciona el envío express?", "¿cómo funciona el envío exprés?"),
+    ("Quisiera hablar con un representante", "quiero hablar con un representante"),
+    ("¿Aceptan pagos con criptomonedas?", "¿aceptan pago con criptomonedas?"),
+    ("Necesito factura de mi compra", "necesito la factura de mi compra"),
+    ("Tengo un problema con mi cuenta", "tengo problemas con mi cuenta"),
+    ("¿Pueden ayudarme a elegir un producto?", "me pueden ayudar a elegir un producto"),
+    ("El producto que recibí está dañado", "el producto que recibi esta dañado"),
+    ("Mi pedido no ha llegado todavía", "mi pedido todavia no ha llegado"),
+]
+
+# (pregunta guardada, pregunta nueva): parecidas pero con otra respuesta
+CASI_IGUALES = [
+    ("si quiero el reembolso", "no quiero el reembolso"),
+    ("iPhone 14", "iPhone 15"),
+    ("talla M", "talla S"),
+    ("¿Tienen este artículo en stock?", "¿Tienen este artículo en stock en talla S?"),
+    ("Mi pedido no ha llegado todavía", "Mi pedido ya ha llegado"),
+    ("¿Hacen envíos internacionales?", "¿Hacen envíos nacionales?"),
+    ("¿Cómo funciona el envío express?", "¿Cómo funciona el envío estándar?"),
+    ("Quisiera hacer una devolución", "Quisiera cancelar una devolución"),
+    ("Necesito factura de mi compra", "Necesito factura de mi compra del pedido 123"),
+    ("¿Aceptan pagos con criptomonedas?", "¿Aceptan pagos con tarjeta?"),
+    ("¿Ofrecen descuentos por cantidad?", "¿Ofrecen descuentos para estudiantes?"),
+    ("Tengo un problema con mi cuenta", "Tengo un problema con mi pago"),
+    ("¿Cuál es el tiempo de entrega?", "¿Cuál es el costo de entrega?"),
+    ("Quisiera hablar con un representante", "No quiero hablar con un representante"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--salida", help="Guarda el informe en un JSON")
+    args = parser.parse_args()
+
+    # El IDF se calcula sobre las preguntas guardadas, como en producción
+    cache = CacheSemantico(2000, 1.0, 2048)
+    for guardada, _ in PARAFRASIS + CASI_IGUALES:
+        cache.guardar(guardada, guardada)
+    pares = []
+    for esperado, lista in ((True, PARAFRASIS), (False, CASI_IGUALES)):
+        for a, b in lista:
+            pares.append({
+                "guardada": a,
+                "nueva": b,
+                "debe_acertar": esperado,
+                "similitud": round(cache.similitud(a, b), 3),
+                "criticas_iguales": palabras_criticas(a) == palabras_criticas(b),
+            })
+
+    umbrales = []
+    for umbral in np.arange(0.6, 1.0, 0.05):
+        acierta = [p for p in pares if p["criticas_iguales"] and p["similitud"] >= umbral]
+        umbrales.append({
+            "umbral": round(float(umbral), 2),
+            "aciertos": sum(p["debe_acertar"] for p in acierta),
+            "falsos_aciertos": sum(not p["debe_acertar"] for p in acierta),
+        })
+        print(f"umbral {umbral:.2f}: {umbrales[-1]['aciertos']}/{len(PARAFRASIS)} paráfrasis, "
+              f"{umbrales[-1]['falsos_aciertos']} falsos aciertos")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"pares": pares, "umbrales": umbrales}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
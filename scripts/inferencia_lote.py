@@ -0,0 +1,100 @@
+# inferencia_lote.py
+"""
+Inferencia offline sobre un archivo de prompts (JSONL o CSV), con el mismo
+prompt y modelo que obtener_respuesta, en lotes grandes agrupados por longitud.
+
+    python scripts/inferencia_lote.py faq.jsonl respuestas.jsonl [--lote 32] [--columna prompt]
+
+Es reanudable: si respuestas.jsonl ya existe, se saltan los ids que ya tiene.
+La salida sirve para precargar la caché con CACHE_PRELOAD_FILE.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services import chat_logic
+
+
+def leer_prompts(ruta: str, columna: str, columna_id: str) -> list:
+    """Lista de (id, prompt). Sin columna de id se usa el número de fila."""
+    with open(ruta, encoding="utf-8", newline="") as f:
+        if ruta.endswith(".csv"):
+            filas = list(csv.DictReader(f))
+        else:
+            filas = [json.loads(linea) for linea in f if linea.strip()]
+    return [(str(fila.get(columna_id, i)), fila[columna]) for i, fila in enumerate(filas) if fila.get(columna)]
+
+
+def ids_procesados(ruta_salida: str) -> set:
+    if not os.path.exists(ruta_salida):
+        return set()
+    procesados = set()
+    with open(ruta_salida, encoding="utf-8") as f:
+        for linea in f:
+            try:
+                procesados.add(json.loads(linea)["id"])
+            except (ValueError, KeyError):
+                # Última línea a medio escribir si el proceso se cortó
+                continue
+    return procesados
+
+
+def agrupar_por_longitud(items: list, tamano_lote: int) -> list:
+    """Ordena por número de tokens y corta en lotes: cada lote tiene longitudes parecidas."""
+    ordenados = sorted(items, key=lambda item: len(item[2]))
+    return [ordenados[i:i + tamano_lote] for i in range(0, len(ordenados), tamano_lote)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("entrada", help="Archivo .jsonl o .csv con los prompts")
+    parser.add_argument("salida", help="Archivo .jsonl de respuestas (también es el checkpoint)")
+    parser.add_argument("--columna", default="prompt", help="Campo con el texto del prompt")
+    parser.add_argument("--columna-id", default="id", help="Campo con el id de cada prompt")
+    parser.add_argument("--lote", type=int, default=32, help="Prompts por llamada al modelo")
+    parser.add_argument("--max-new-tokens", type=int, default=chat_logic.MAX_NEW_TOKENS)
+    args = parser.parse_args()
+
+    prompts = leer_prompts(args.entrada, args.columna, args.columna_id)
+    hechos = ids_procesados(args.salida)
+    pendientes = [(id_, prompt) for id_, prompt in prompts if id_ not in hechos]
+    print(f"{len(prompts)} prompts, {len(hechos)} ya procesados, {len(pendientes)} pendientes")
+    if not pendientes:
+        return
+
+    chat_logic.cargar_modelo()
+    items = [(id_, prompt, chat_logic.construir_ids(prompt)) for id_, prompt in pendientes]
+    lotes = agrupar_por_longitud(items, args.lote)
+
+    inicio_total = time.perf_counter()
+    with open(args.salida, "a", encoding="utf-8") as salida:
+        for n, lote in enumerate(lotes, start=1):
+            inicio = time.perf_counter()
+            respuestas, _ = chat_logic.generar_lote([ids for _, _, ids in lote], max_new_tokens=args.max_new_tokens)
+            latencia = time.perf_counter() - inicio
+            for (id_, prompt, ids), respuesta in zip(lote, respuestas):
+                salida.write(json.dumps({
+                    "id": id_,
+                    "prompt": prompt,
+                    "respuesta": respuesta,
+                    "tokens_entrada": len(ids),
+                    "tamano_lote": len(lote),
+                    "latencia_lote_s": round(latencia, 4),
+                    "latencia_s": round(latencia / len(lote), 4),
+                }, ensure_ascii=False) + "\n")
+            # Checkpoint por lote: lo escrito sobrevive a un corte
+            salida.flush()
+            os.fsync(salida.fileno())
+            print(f"Lote {n}/{len(lotes)}: {len(lote)} prompts en {latencia:.2f}s")
+
+    total = time.perf_counter() - inicio_total
+    print(f"{len(pendientes)} respuestas en {total:.1f}s ({len(pendientes) / total:.2f} prompts/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# paridad_int8.py
+"""
+Compara el modelo fp32 con su versión cuantizada int8: respuestas y latencia.
+
+    python scripts/paridad_int8.py [--prompts prompts.txt] [--repeticiones 3] [--salida informe.json]
+"""
+import argparse
+import difflib
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services import chat_logic
+
+# Las mismas preguntas que genera simulacion_chatbot.py
+PROMPTS_POR_DEFECTO = [
+    "Hola, necesito ayuda con un producto",
+    "¿Tienen este artículo en stock?",
+    "Quisiera hacer una devolución",
+    "¿Cuál es el tiempo de entrega?",
+    "Necesito información sobre garantías",
+    "¿Ofrecen descuentos por cantidad?",
+    "Mi pedido no ha llegado todavía",
+    "¿Hacen envíos internacionales?",
+    "El producto que recibí está dañado",
+]
+
+
+def generar(modelo, prompt: str) -> str:
+    tokenizer = modelo.tokenizer
+    lote = tokenizer([chat_logic.construir_entrada(prompt)], return_tensors="pt")
+    salida = modelo.model.generate(
+        **lote, max_new_tokens=chat_logic.MAX_NEW_TOKENS, do_sample=False, pad_token_id=tokenizer.pad_token_id
+    )
+    if not modelo.model.config.is_encoder_decoder:
+        salida = salida[:, lote["input_ids"].shape[1]:]
+    return tokenizer.decode(salida[0], skip_special_tokens=True).strip()
+
+
+def medir(modelo, prompts: list, repeticiones: int):
+    import torch
+
+    respuestas, latencias = [], []
+    with torch.no_grad():
+        generar(modelo, prompts[0])  # calentamiento
+        for prompt in prompts:
+            tiempos = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                respuesta = generar(modelo, prompt)
+                tiempos.append(time.perf_counter() - inicio)
+            respuestas.append(respuesta)
+            latencias.append(statistics.median(tiempos))
+    return respuestas, latencias
+
+
+def tamano_mb(modelo) -> float:
+    import io
+
+    import torch
+
+    buffer = io.BytesIO()
+    torch.save(modelo.model.state_dict(), buffer)
+    return round(buffer.tell() / 1e6, 1)
+
+
+def resumen_latencia(latencias: list) -> dict:
+    ordenadas = sorted(latencias)
+    return {
+        "media_s": round(statistics.mean(ordenadas), 4),
+        "p50_s": round(ordenadas[len(ordenadas) // 2], 4),
+        "p95_s": round(ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))], 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompts", help="Archivo de texto con un prompt por línea")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--salida", help="Ruta donde guardar el informe JSON")
+    args = parser.parse_args()
+
+    prompts = PROMPTS_POR_DEFECTO
+    if args.prompts:
+        with open(args.prompts, encoding="utf-8") as f:
+            prompts = [linea.strip() for linea in f if linea.strip()]
+
+    chat_logic.configurar_hilos()
+    resultados = {}
+    for precision in ("fp32", "int8"):
+        print(f"Midiendo {precision}...")
+        modelo = chat_logic.crear_pipeline(precision)
+        respuestas, latencias = medir(modelo, prompts, args.repeticiones)
+        resultados[precision] = {
+            "respuestas": respuestas,
+            "latencia": resumen_latencia(latencias),
+            "tamano_mb": tamano_mb(modelo),
+        }
+        del modelo
+
+    base, cuantizado = resultados["fp32"], resultados["int8"]
+    similitudes = [
+        difflib.SequenceMatcher(None, a, b).ratio()
+        for a, b in zip(base["respuestas"], cuantizado["respuestas"])
+    ]
+    informe = {
+        "modelo": chat_logic.MODEL_NAME,
+        "prompts": len(prompts),
+        "hilos_intra_op": chat_logic.INTRA_OP_THREADS or "por defecto",
+        "coincidencias_exactas": sum(a == b for a, b in zip(base["respuestas"], cuantizado["respuestas"])),
+        "similitud_media": round(statistics.mean(similitudes), 4),
+        "fp32": {k: v for k, v in base.items() if k != "respuestas"},
+        "int8": {k: v for k, v in cuantizado.items() if k != "respuestas"},
+        "aceleracion_p50": round(base["latencia"]["p50_s"] / cuantizado["latencia"]["p50_s"], 2),
+        "detalle": [
+            {"prompt": p, "fp32": a, "int8": b, "similitud": round(s, 4)}
+            for p, a, b, s in zip(prompts, base["respuestas"], cuantizado["respuestas"], similitudes)
+        ],
+    }
+
+    texto = json.dumps(informe, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    print(texto)
+
+
+if __name__ == "__main__":
+    main()